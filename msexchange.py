@@ -5,6 +5,7 @@ import time
 from datetime import datetime
 from urllib.request import urlopen
 import logging.config
+from timeseries import TimeSeries
 
 __author__ = 'scott@flakshack.com (Scott Vintinner)'
 
@@ -21,20 +22,20 @@ class MonitorJSON:
         self.edge1_receive_total = 0
         self.edge1_previous_send_total = 0
         self.edge1_previous_receive_total = 0
-        self.edge1_send_datapoints = []
-        self.edge1_receive_datapoints = []
+        self.edge1_send_datapoints = TimeSeries(MAX_DATAPOINTS, "q")
+        self.edge1_receive_datapoints = TimeSeries(MAX_DATAPOINTS, "q")
         self.edge2_send_total = 0
         self.edge2_receive_total = 0
         self.edge2_previous_send_total = 0
         self.edge2_previous_receive_total = 0
-        self.edge2_send_datapoints = []
-        self.edge2_receive_datapoints = []
-        self.server1_avg_latency = []
-        self.server1_active_users = []
-        self.server1_ops = []
-        self.server2_avg_latency = []
-        self.server2_active_users = []
-        self.server2_ops = []
+        self.edge2_send_datapoints = TimeSeries(MAX_DATAPOINTS, "q")
+        self.edge2_receive_datapoints = TimeSeries(MAX_DATAPOINTS, "q")
+        self.server1_avg_latency = TimeSeries(MAX_DATAPOINTS, "q")
+        self.server1_active_users = TimeSeries(MAX_DATAPOINTS, "q")
+        self.server1_ops = TimeSeries(MAX_DATAPOINTS, "q")
+        self.server2_avg_latency = TimeSeries(MAX_DATAPOINTS, "q")
+        self.server2_active_users = TimeSeries(MAX_DATAPOINTS, "q")
+        self.server2_ops = TimeSeries(MAX_DATAPOINTS, "q")
         self.datetime = datetime(2000, 1, 1)
 
         self.json = json.dumps({
@@ -96,12 +97,6 @@ def generate_json(perf_monitor):
         perf_monitor.edge1_send_total = smtp_send_total - perf_monitor.edge1_previous_send_total
         perf_monitor.edge1_receive_total = smtp_receive_total - perf_monitor.edge1_previous_receive_total
 
-    # If we've reached the max datapoints, delete the oldest
-    if len(perf_monitor.edge1_send_datapoints) >= MAX_DATAPOINTS:
-        del(perf_monitor.edge1_send_datapoints[0])
-    if len(perf_monitor.edge1_receive_datapoints) >= MAX_DATAPOINTS:
-        del(perf_monitor.edge1_receive_datapoints[0])
-
     # ====================EDGE2=====================
     try:
         response = urlopen('http://edge2:8001')
@@ -140,12 +135,6 @@ def generate_json(perf_monitor):
         perf_monitor.edge2_send_total = smtp_send_total - perf_monitor.edge2_previous_send_total
         perf_monitor.edge2_receive_total = smtp_receive_total - perf_monitor.edge2_previous_receive_total
 
-    # If we've reached the max datapoints, delete the oldest
-    if len(perf_monitor.edge2_send_datapoints) >= MAX_DATAPOINTS:
-        del(perf_monitor.edge2_send_datapoints[0])
-    if len(perf_monitor.edge2_receive_datapoints) >= MAX_DATAPOINTS:
-        del(perf_monitor.edge2_receive_datapoints[0])
-
     # Exch 2016+ {"active_users": 62.0, "average_latency": 2.0, "operations_per_second": 5.9956325622022675}
     # ====================server1=====================
     try:
@@ -163,12 +152,6 @@ def generate_json(perf_monitor):
     perf_monitor.server1_avg_latency.append(int(data["average_latency"]))
     perf_monitor.server1_ops.append(int(data["operations_per_second"]))
 
-    # If we've reached the max datapoints, delete the oldest
-    if len(perf_monitor.server1_active_users) >= MAX_DATAPOINTS:
-        del(perf_monitor.server1_active_users[0])
-        del(perf_monitor.server1_avg_latency[0])
-        del(perf_monitor.server1_ops[0])
-
     # ====================server2=====================
     try:
         response = urlopen('http://exmbx2.rbh.local:4901')
@@ -185,28 +168,22 @@ def generate_json(perf_monitor):
     perf_monitor.server2_avg_latency.append(int(data["average_latency"]))
     perf_monitor.server2_ops.append(int(data["operations_per_second"]))
 
-    # If we've reached the max datapoints, delete the oldest
-    if len(perf_monitor.server2_active_users) >= MAX_DATAPOINTS:
-        del(perf_monitor.server2_active_users[0])
-        del(perf_monitor.server2_avg_latency[0])
-        del(perf_monitor.server2_ops[0])
-
     # Create the JSON string for output
     perf_monitor.json = json.dumps({
-        "edge1_send_datapoints": perf_monitor.edge1_send_datapoints,
-        "edge1_receive_datapoints": perf_monitor.edge1_receive_datapoints,
+        "edge1_send_datapoints": perf_monitor.edge1_send_datapoints.values(),
+        "edge1_receive_datapoints": perf_monitor.edge1_receive_datapoints.values(),
         "edge1_send_total": perf_monitor.edge1_send_total,
         "edge1_receive_total": perf_monitor.edge1_receive_total,
-        "edge2_send_datapoints": perf_monitor.edge2_send_datapoints,
-        "edge2_receive_datapoints": perf_monitor.edge2_receive_datapoints,
+        "edge2_send_datapoints": perf_monitor.edge2_send_datapoints.values(),
+        "edge2_receive_datapoints": perf_monitor.edge2_receive_datapoints.values(),
         "edge2_send_total": perf_monitor.edge2_send_total,
         "edge2_receive_total": perf_monitor.edge2_receive_total,
-        "server1_avg_latency": perf_monitor.server1_avg_latency,
-        "server1_active_users": perf_monitor.server1_active_users,
-        "server1_ops": perf_monitor.server1_ops,
-        "server2_avg_latency": perf_monitor.server2_avg_latency,
-        "server2_active_users": perf_monitor.server2_active_users,
-        "server2_ops": perf_monitor.server2_ops
+        "server1_avg_latency": perf_monitor.server1_avg_latency.values(),
+        "server1_active_users": perf_monitor.server1_active_users.values(),
+        "server1_ops": perf_monitor.server1_ops.values(),
+        "server2_avg_latency": perf_monitor.server2_avg_latency.values(),
+        "server2_active_users": perf_monitor.server2_active_users.values(),
+        "server2_ops": perf_monitor.server2_ops.values()
     })
 
     logger.debug(perf_monitor.json)
@@ -11,6 +11,8 @@ Examples: https://github.com/NetApp/ontap-rest-python/tree/master/examples/rest_
 import json
 import time
 import logging.config
+from timeseries import TimeSeries, json_default
+from ttlcache import shared_cache
 import base64
 import requests
 requests.packages.urllib3.disable_warnings()
@@ -24,15 +26,20 @@ __author__ = 'scott@flakshack.com (Scott Vintinner)'
 NETAPP_URL = "https://netapp1/api"
 SAMPLE_INTERVAL = 60
 MAX_DATAPOINTS = 30
+# Data that changes slowly is only requested this often (seconds).  In between, the value is served from the
+# shared cache (see ttlcache.py).  Anything not listed is requested every SAMPLE_INTERVAL.
+REFRESH_INTERVALS = {
+    "storage": 900                  # /storage/cluster capacity and efficiency
+}
 # ===============================================================================
 
 
 class NetAppData:
     """This class will contain all of the data gathered during processing"""
     def __init__(self):
-        self.iops = []
-        self.throughput = []
-        self.latency = []
+        self.iops = TimeSeries(MAX_DATAPOINTS, "q")
+        self.throughput = TimeSeries(MAX_DATAPOINTS)
+        self.latency = TimeSeries(MAX_DATAPOINTS)
         self.node_status = "ERR"
         self.used = 0
         self.available = 0
@@ -61,6 +68,16 @@ class NetAppRequestException(Exception):
     pass
 
 
+def get_storage(session):
+    """Returns the decoded /storage/cluster JSON."""
+    logger = logging.getLogger("netapp")
+    logger.debug("Getting: " + NETAPP_URL + "/storage/cluster")
+    r = session.get(NETAPP_URL + "/storage/cluster", verify=False)
+    if r.status_code != 200:
+        raise NetAppRequestException("Request error status: " + str(r.status_code) + " " + r.reason)
+    return r.json()  # Convert returned byte stream to json
+
+
 def generate_json(netapp_monitor):
     """This function will connect to the NetApp RESTAPI, parse data and store the output in netapp_monitor.json"""
 
@@ -93,11 +110,10 @@ def generate_json(netapp_monitor):
         netapp_monitor.data.node_status = cluster['metric']['status']
 
         # ############ /storage/cluster ###############
-        logger.debug("Getting: " + NETAPP_URL + "/storage/cluster")
-        r = netapp_monitor.session.get(NETAPP_URL + "/storage/cluster", verify=False)
-        if r.status_code != 200:
-            raise NetAppRequestException("Request error status: " + str(r.status_code) + " " + r.reason)
-        storage = r.json()  # Convert returned byte stream to json
+        # Capacity changes slowly, so this is only requested every REFRESH_INTERVALS["storage"] seconds
+        session = netapp_monitor.session
+        storage = shared_cache.get(NETAPP_URL + "/storage/cluster", lambda: get_storage(session),
+                                   REFRESH_INTERVALS.get("storage", 0))
 
         # Status
         netapp_monitor.data.used = int(storage['block_storage']['used'] / (1024*1024*1024))
@@ -105,14 +121,8 @@ def generate_json(netapp_monitor):
         netapp_monitor.data.logical_used = int(storage['efficiency_without_snapshots']['logical_used'] / (1024 * 1024 * 1024))
         netapp_monitor.data.saved = int(storage['efficiency_without_snapshots']['savings'] / (1024 * 1024 * 1024))
 
-        # If we already have the max number of datapoints in our list, delete the oldest item
-        if len(netapp_monitor.data.iops) > MAX_DATAPOINTS:
-            del(netapp_monitor.data.iops[0])
-            del(netapp_monitor.data.latency[0])
-            del(netapp_monitor.data.throughput[0])
-
         # Format our output as json under the stats name
-        output = json.dumps({"stats": netapp_monitor.data.__dict__})
+        output = json.dumps({"stats": netapp_monitor.data.__dict__}, default=json_default)
 
         # ====================================
         # Generate JSON output and assign to netapp_monitor object (for return back to caller module)
@@ -0,0 +1,226 @@
+"""nutanix_client - Shared Prism gateway client used by the Nutanix modules.
+
+Each Prism gateway gets a single NutanixClient (use NutanixClient.get), so all of the Nutanix panels for a cluster
+share one requests session instead of each logging in with their own.
+
+Responses are kept in a short-lived cache: a module asking for the same URL (with the same parameters) within
+CACHE_SECONDS gets the same decoded JSON without another request to Prism.  Modules that collect every minute on
+the same cluster are therefore served from one request per cycle.  Slow-changing data (like the hourly BASIC_INFO
+list of VMs) can be cached for longer by passing max_age.
+
+Large lists (like /vms/ on a big VDI cluster, which is many MB of JSON) can be read with get_entities(path,
+parameters, fields).  The response is parsed as it is downloaded, one entity at a time, and only the fields asked
+for are kept, so we never hold the whole body or the full decoded response in memory.
+
+The /utils/entities stats are requested with entity_stats(entity_type, fields).  Every field any module has asked
+for (or registered) for an entity type is included in the projection, so the IOPS and CPU ready panels for a
+cluster both come from a single call.
+
+    client = NutanixClient.get("https://pri-svr:9440/PrismGateway/services/rest/v1")
+    client.register("vm", ["hypervisor_num_iops"])      # When the module starts (so the first call includes it)
+    cluster = client.get_json("/cluster/")
+    entities = client.entity_stats("vm", ["hypervisor_num_iops"])
+    vms = client.get_entities("/vms/", {'projection': 'BASIC_INFO'}, ["vmId", "vmName"], 3600)
+
+"""
+import codecs
+import json
+import logging
+import threading
+import time
+import requests
+from credentials import NUTANIX_USER  # Login info now stored in credentials.py
+from credentials import NUTANIX_PASSWORD  # Login info now stored in credentials.py
+
+__author__ = 'scott@flakshack.com (Scott Vintinner)'
+
+# =================================SETTINGS======================================
+CACHE_SECONDS = 15              # Modules asking for the same data within this many seconds share one request
+STREAM_CHUNK_SIZE = 65536       # Bytes read from the response at a time by get_entities
+# ===============================================================================
+
+
+class NutanixRequestException(Exception):
+    pass
+
+
+class JSONStream:
+    """Decodes JSON values one at a time from an iterable of text chunks (see iter_json_items)."""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _read(self):
+        """Adds the next chunk to the buffer (dropping what we've already decoded).  Returns False at the end."""
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character ("" at the end of the data)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ""
+
+    def expect(self, characters):
+        """Reads the next character, which has to be one of characters, and returns it."""
+        character = self.peek()
+        if character == "" or character not in characters:
+            raise ValueError("Expected one of " + characters + " at: " + repr(self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+        return character
+
+    def value(self):
+        """Decodes the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number might continue in the next chunk, so it has to be followed by a separator
+                if end < len(self.buffer) and self.buffer[end] in " \t\r\n,:]}":
+                    self.pos = end
+                    return value
+            except ValueError:
+                pass        # The value isn't all in the buffer yet
+            if not self._read():
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                return value
+
+
+def iter_json_items(chunks, key):
+    """Yields the items of the list named key in a JSON object, decoding one item at a time from chunks (an
+    iterable of text).  The other values in the object are decoded and thrown away."""
+    stream = JSONStream(chunks)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        name = stream.value()
+        stream.expect(":")
+        if name == key and stream.peek() == "[":
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.expect("]")
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.expect(",]") == "]":
+                        break
+        else:
+            stream.value()
+        if stream.expect(",}") == "}":
+            return
+
+
+def iter_text(response):
+    """Yields the body of a streamed requests response as text (it is always UTF-8 for the Prism API)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+class NutanixClient:
+    """A single Prism gateway.  Use NutanixClient.get() so every module shares the same object."""
+    all_clients = {}                    # url -> NutanixClient
+    _all_clients_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, url):
+        """Returns the shared NutanixClient for this Prism gateway URL."""
+        with cls._all_clients_lock:
+            if url not in cls.all_clients:
+                cls.all_clients[url] = cls(url)
+            return cls.all_clients[url]
+
+    def __init__(self, url):
+        self.url = url
+        self.session = None
+        self.cache = {}                 # (path, parameters, fields) -> (time.monotonic(), max_age, decoded JSON)
+        self.projections = {}           # entity type -> set of every field any module has asked for
+        self.lock = threading.RLock()   # Only one module talks to the gateway at a time
+
+    def reset(self):
+        """Forget the session and the cached responses (so we start over next time)."""
+        self.session = None
+        self.cache = {}
+
+    def get_json(self, path, parameters=None, max_age=CACHE_SECONDS):
+        """Returns the decoded JSON from url + path, from the cache if we got it within max_age seconds.
+        The result is shared, so don't change it.  Raises an exception if the request fails."""
+        return self._get(path, parameters, max_age, None)
+
+    def get_entities(self, path, parameters=None, fields=(), max_age=CACHE_SECONDS):
+        """Returns a list with a dictionary of the listed fields for each item in the "entities" list of the
+        response from url + path (missing fields are None).  The response is parsed as it is downloaded, so only
+        these fields are kept in memory.  Cached and shared like get_json."""
+        return self._get(path, parameters, max_age, tuple(fields))
+
+    def _get(self, path, parameters, max_age, fields):
+        logger = logging.getLogger(__name__)
+        key = (path, tuple(sorted((parameters or {}).items())), fields)
+        with self.lock:
+            now = time.monotonic()
+            cached = self.cache.get(key)
+            if cached is not None and now - cached[0] < max_age:
+                return cached[2]
+
+            # Check if there is a working session and create a new one if it is not working
+            if self.session is None:
+                logger.debug("No existing REST API session to " + self.url + ", creating a new one.")
+                # Create Session object that will allow us to issue commands without having to login each time
+                self.session = requests.Session()
+                self.session.headers.update({'content-type': 'application/json'})
+                self.session.auth = (NUTANIX_USER, NUTANIX_PASSWORD)
+
+            try:
+                logger.debug("Getting: " + self.url + path + " " + str(parameters or ""))
+                r = self.session.get(self.url + path, params=parameters, verify=False, stream=fields is not None)
+                try:
+                    if r.status_code != 200:
+                        raise NutanixRequestException("Request error status: " + str(r.status_code) + " " +
+                                                      r.reason)
+                    if fields is None:
+                        data = r.json()
+                    else:
+                        data = [{field: entity.get(field) for field in fields}
+                                for entity in iter_json_items(iter_text(r), "entities")]
+                finally:
+                    r.close()
+            except Exception:
+                # Set the session object to None and try again next time
+                self.reset()
+                raise
+
+            # Drop the responses that have expired (like stats requested with a smaller projection)
+            self.cache = {cache_key: value for cache_key, value in self.cache.items() if now - value[0] < value[1]}
+            self.cache[key] = (now, max_age, data)
+            return data
+
+    def register(self, entity_type, fields):
+        """Adds fields to the /utils/entities projection for entity_type."""
+        with self.lock:
+            self.projections.setdefault(entity_type, set()).update(fields)
+
+    def entity_stats(self, entity_type, fields, filter_criteria='power_state==on', max_age=CACHE_SECONDS):
+        """Returns the list of entities of entity_type from /utils/entities with at least the fields asked for
+        (and every other field registered for that entity type).
+
+        Note that this is a private API call from Nutanix to optimize data retrieval.
+        It might not work in future versions."""
+        with self.lock:
+            projection = self.projections.setdefault(entity_type, set())
+            projection.update(fields)
+            parameters = {'entityType': entity_type,
+                          'projection': ",".join(sorted(projection)),
+                          'filterCriteria': filter_criteria}
+            return self.get_json("/utils/entities", parameters, max_age)["entities"]
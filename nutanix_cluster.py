@@ -1,5 +1,7 @@
 #!/usr/bin/env python
-"""nutanix_1 - Uses Nutanix REST API to get summary of performance stats.
+"""nutanix_cluster - Uses Nutanix REST API to get summary of performance stats.
+
+Provides the nutanix_svr and nutanix_vdi panels (one for each cluster in INSTANCES).
 
 Requires requests
 pip install requests
@@ -7,43 +9,43 @@ pip install requests
 """
 import json
 import time
-import requests
 import logging.config
-from credentials import NUTANIX_USER  # Login info now stored in credentials.py
-from credentials import NUTANIX_PASSWORD  # Login info now stored in credentials.py
+from nutanix_client import NutanixClient
+from timeseries import TimeSeries, json_default
 
 __author__ = 'scott@flakshack.com (Scott Vintinner)'
 
 # =================================SETTINGS======================================
-NUTANIX_URL = "https://pri-svr:9440/PrismGateway/services/rest/v1"
+# Each panel (the name used with SysAdminBoardModule in webserver.py) and the Prism URL for its cluster
+INSTANCES = {
+    "nutanix_svr": "https://pri-svr:9440/PrismGateway/services/rest/v1",
+    "nutanix_vdi": "https://pri-vdi:9440/PrismGateway/services/rest/v1"
+}
 SAMPLE_INTERVAL = 60
 MAX_DATAPOINTS = 30
 # ===============================================================================
 
 
-class NutanixRequestException(Exception):
-    pass
-
-
 class NutanixData:
     """This class will contain all of the data gathered during processing"""
     def __init__(self):
         self.cluster_name = ""
-        self.iops = []
-        self.throughput = []
-        self.latency = []
-        self.replication = []
+        self.iops = TimeSeries(MAX_DATAPOINTS, "q")
+        self.throughput = TimeSeries(MAX_DATAPOINTS)
+        self.latency = TimeSeries(MAX_DATAPOINTS)
+        self.replication = TimeSeries(MAX_DATAPOINTS, "q")
         self.usage_gbytes = 0
         self.capacity_gbytes = 0
-        self.cpu_percent = []
-        self.ram_percent = []
+        self.cpu_percent = TimeSeries(MAX_DATAPOINTS)
+        self.ram_percent = TimeSeries(MAX_DATAPOINTS)
 
 
 class MonitorJSON:
     """This is a simple class passed to Monitor threads so we can access the current JSON data in that thread"""
-    def __init__(self):
+    def __init__(self, name):
+        self.name = name
+        self.client = NutanixClient.get(INSTANCES[name])     # Shared with the other Nutanix modules
         self.json = ""
-        self.session = None
         self.data = NutanixData()
 
 
@@ -53,33 +55,20 @@ def generate_json(monitor):
     will be stored in json format in the json property.
     """
 
-    logger = logging.getLogger("nutanix_1")
+    logger = logging.getLogger(monitor.name)
     # Really don't need to hear about connections being brought up again after server has closed it
     logging.getLogger("requests.packages.urllib3.connectionpool").setLevel(logging.WARNING)
 
-    # Check if there is a working session and create a new one if it is not working
-    if monitor.session is None:
-        logger.debug("No existing REST API session, creating a new one.")
-        # Create Session object that will allow us to issue commands without having to login each time
-        monitor.session = requests.Session()
-        monitor.session.headers.update({'content-type': 'application/json'})
-        monitor.session.auth = (NUTANIX_USER, NUTANIX_PASSWORD)
-
+    nutanix_url = monitor.client.url
     try:    # Try getting the cluster data
-        logger.debug("Getting: " + NUTANIX_URL + "/cluster/")
-        r = monitor.session.get(NUTANIX_URL + "/cluster/", verify=False)
-        if r.status_code != 200:
-            raise NutanixRequestException("Request error status: " + str(r.status_code) + " " + r.reason)
+        cluster = monitor.client.get_json("/cluster/")
     except Exception as error:
-        # If we couldn't connect, set the session object to None and try again next time
-        logger.error("Unable to get  " + NUTANIX_URL + "/cluster/" + " " + str(error))
-        monitor.json = json.dumps({"error": "Unable to get  " + NUTANIX_URL + "/cluster/" +
+        # If we couldn't connect, the client drops its session and we try again next time
+        logger.error("Unable to get  " + nutanix_url + "/cluster/" + " " + str(error))
+        monitor.json = json.dumps({"error": "Unable to get  " + nutanix_url + "/cluster/" +
                                             " " + str(error)}, indent=4)
-        monitor.session = None
         return
 
-    cluster = r.json()       # Convert returned byte stream to json
-
     logger.debug("Data successfully collected from " + cluster["name"])
     iops = int(cluster["stats"]["controller_num_iops"])
     latency = round((int(cluster["stats"]["controller_avg_io_latency_usecs"])) / 1000, 2)  # convert to ms
@@ -102,18 +91,8 @@ def generate_json(monitor):
     monitor.data.usage_gbytes = usage_gbytes
     monitor.data.capacity_gbytes = capacity_gbytes
 
-    # If we already have the max number of datapoints in our list, delete the oldest item
-    if len(monitor.data.iops) > MAX_DATAPOINTS:
-        logger.debug("MAX_DATAPOINTS of " + str(MAX_DATAPOINTS) + " hit, removing oldest datapoints.")
-        del (monitor.data.iops[0])
-        del (monitor.data.throughput[0])
-        del (monitor.data.latency[0])
-        del (monitor.data.replication[0])
-        del (monitor.data.cpu_percent[0])
-        del (monitor.data.ram_percent[0])
-#
     # Format our output as json under the stats name
-    output = json.dumps({"stats": monitor.data.__dict__})
+    output = json.dumps({"stats": monitor.data.__dict__}, default=json_default)
 
     # ====================================
     # Generate JSON output and assign to nutanix_monitor object (for return back to caller module)
@@ -146,10 +125,11 @@ if __name__ == '__main__':
         print("Error parsing logger config file: " + str(e))
         raise
 
-    test_monitor = MonitorJSON()
+    test_monitors = [MonitorJSON(name) for name in INSTANCES]
     while True:
         main_logger = logging.getLogger(__name__)
-        generate_json(test_monitor)
+        for test_monitor in test_monitors:
+            generate_json(test_monitor)
 
         # Wait X seconds for the next iteration
         main_logger.debug("Waiting for " + str(SAMPLE_INTERVAL) + " seconds")
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+"""nutanix_vm - Uses Nutanix REST API to get summary of performance stats for the busiest VMs.
+
+Provides the nutanix_vm_svr/nutanix_vm_vdi (IOPS, throughput and latency) and nutanix_*_vm_cpu_ready (CPU and
+ready time) panels.  Each panel is listed in INSTANCES with the cluster it shows and the stats it needs.
+
+All of the panels for the same cluster share one nutanix_client.NutanixClient (one session to the Prism gateway).
+The stats for every panel are requested together in one /utils/entities call with a merged projection, and the
+hourly BASIC_INFO list of VMs is cached by the client as well, so the IOPS and CPU ready panels for a cluster don't
+each make their own requests.
+
+Requires requests
+pip install requests
+
+"""
+import json
+import time
+import operator
+import heapq
+import logging.config
+from nutanix_client import NutanixClient
+from timeseries import TimeSeries
+from registry import EntityRegistry
+
+__author__ = 'scott@flakshack.com (Scott Vintinner)'
+
+# =================================SETTINGS======================================
+NUTANIX_CLUSTERS = {
+    "pri-svr": "https://pri-svr:9440/PrismGateway/services/rest/v1",
+    "pri-vdi": "https://pri-vdi:9440/PrismGateway/services/rest/v1"
+}
+# Each panel (the name used with SysAdminBoardModule in webserver.py) and its settings:
+#   cluster:        One of the NUTANIX_CLUSTERS
+#   stats:          "io" for IOPS, throughput and latency or "cpu_ready" for CPU and ready time
+#   max_datapoints: Number of datapoints to graph
+#   sort_by:        (io only) Results sort options: IOPS, THROUGHPUT, LATENCY
+#   per_vcpu:       (cpu_ready only) Divide the ready time by the number of vCPUs (default True)
+INSTANCES = {
+    "nutanix_vm_svr": {"cluster": "pri-svr", "stats": "io", "max_datapoints": 30, "sort_by": "IOPS"},
+    "nutanix_vm_vdi": {"cluster": "pri-vdi", "stats": "io", "max_datapoints": 30, "sort_by": "IOPS"},
+    "nutanix_svr_vm_cpu_ready": {"cluster": "pri-svr", "stats": "cpu_ready", "max_datapoints": 10},
+    "nutanix_vdi_vm_cpu_ready": {"cluster": "pri-vdi", "stats": "cpu_ready", "max_datapoints": 10},
+    "nutanix_vm_cpu_ready": {"cluster": "pri-vdi", "stats": "cpu_ready", "max_datapoints": 30, "per_vcpu": False}
+}
+SAMPLE_INTERVAL = 60
+MAX_VM_RESULTS = 20              # Number of VMs to get data (should match html file)
+EXCLUDE_VM = []                  # VMs with any of the items in this list in their
+#                                  name will be excluded from results (ex: "NTNX-123")
+FULL_UPDATE_SECONDS = 3600       # How often to refresh the list of VMs (BASIC_INFO)
+# ===============================================================================
+
+
+class NutanixVM:
+    """Class to contain VM specific data"""
+    def __init__(self, vm_id, vm_name, vm_vcpu_count, settings):
+        self.name = vm_name
+        self.vm_id = vm_id
+        self.vcpu_count = vm_vcpu_count
+        self.settings = settings
+        self.relative_weight = 0.0
+        self.last_updated = 0
+
+
+class IOStatsVM(NutanixVM):
+    """IOPS, throughput and latency for the nutanix_vm panels"""
+    STATS = ("hypervisor_num_iops", "hypervisor_io_bandwidth_kBps", "hypervisor_avg_io_latency_usecs")
+
+    def __init__(self, vm_id, vm_name, vm_vcpu_count, settings):
+        NutanixVM.__init__(self, vm_id, vm_name, vm_vcpu_count, settings)
+        self.iops = TimeSeries(settings["max_datapoints"], "q")
+        self.throughput = TimeSeries(settings["max_datapoints"])
+        self.latency = TimeSeries(settings["max_datapoints"])
+
+    def update_relative_weight(self):
+        """The relative weight is used to determine how much we want to see the data of this VM."""
+        self.relative_weight = 1
+
+        # Determine which list we'll use to sort by
+        sort_list = self.iops
+        sort_by = self.settings.get("sort_by", "IOPS")
+        if sort_by == "IOPS":
+            sort_list = self.iops
+        elif sort_by == "THROUGHPUT":
+            sort_list = self.throughput
+        elif sort_by == "LATENCY":
+            sort_list = self.latency
+
+        # Add up all of the historical counter datapoints (higher counter = more weight)
+        # (the TimeSeries keeps a running total, so this doesn't have to loop through the history)
+        self.relative_weight += sort_list.total()
+
+    def update(self, entity, logger):
+        # Update the master stats with updated stats
+        iops = int(entity["hypervisor_num_iops"])
+        throughput = round((int(entity["hypervisor_io_bandwidth_kBps"])) / 1024, 2)  # Convert to MBps
+        latency = round((int(entity["hypervisor_avg_io_latency_usecs"]) / 1000), 1)      # Convert to ms
+
+        # Store the list data in the VM object
+        self.iops.append(iops)
+        self.throughput.append(throughput)
+        self.latency.append(latency)
+
+        # Update ranking value of this VM to determine if we should show it
+        self.update_relative_weight()
+        # Note the time when we updated this VM's stats
+        self.last_updated = time.time()
+
+    def output(self):
+        return {
+            "name": self.name,
+            "iops": self.iops.values(),
+            "throughput": self.throughput.values(),
+            "latency": self.latency.values()
+        }
+
+
+class CPUReadyVM(NutanixVM):
+    """CPU and CPU ready time for the nutanix_*_vm_cpu_ready panels"""
+    STATS = ("hypervisor_cpu_usage_ppm", "hypervisor.cpu_ready_time_ppm")
+
+    def __init__(self, vm_id, vm_name, vm_vcpu_count, settings):
+        NutanixVM.__init__(self, vm_id, vm_name, vm_vcpu_count, settings)
+        self.cpu = TimeSeries(settings["max_datapoints"])
+        self.ready = TimeSeries(settings["max_datapoints"])
+
+    def update_relative_weight(self):
+        """The relative weight is used to determine how much we want to see the data of this VM."""
+        self.relative_weight = 1
+
+        # Add up all of the historical counter datapoints (higher counter = more weight)
+        # (the TimeSeries keeps a running total, so this doesn't have to loop through the history)
+        self.relative_weight += self.ready.total()
+
+    def update(self, entity, logger):
+        cpu = round((int(entity["hypervisor_cpu_usage_ppm"]) / 10000), 1)      # 1 decimal percent
+        # Check if CPU is 0 (computer was turned off) before checking the ready time (which won't exist)
+        if cpu == 0:
+            logger.debug("VM was turned off: " + self.name)
+            self.cpu.clear()
+            self.cpu.append(0)
+            self.ready.clear()
+            self.ready.append(0)
+            self.relative_weight = 0.0
+            self.last_updated = 0
+
+        else:
+            # cpu_ready_time_ppm definition: Value of cpu.ready.summation for a VM in percentage.
+            ready = int(entity["hypervisor.cpu_ready_time_ppm"]) / 10000
+            if self.settings.get("per_vcpu", True):
+                # Divide the Ready Time percentage by the number of vCPUs
+                ready = ready / self.vcpu_count
+            ready = round(ready, 1)      # 1 decimal percent
+            # Store the list data in the VM object
+            self.cpu.append(cpu)
+            self.ready.append(ready)
+
+            # Update ranking value of this VM to determine if we should show it
+            self.update_relative_weight()
+            # Note the time when we updated this VM's stats
+            self.last_updated = time.time()
+
+    def output(self):
+        return {
+            "name": self.name,
+            "cpu": self.cpu.values(),
+            "ready": self.ready.values(),
+        }
+
+
+VM_TYPES = {"io": IOStatsVM, "cpu_ready": CPUReadyVM}
+
+
+class MonitorJSON:
+    """This is a simple class passed to Monitor threads so we can access the current JSON data in that thread"""
+    def __init__(self, name):
+        self.name = name
+        self.settings = INSTANCES[name]
+        self.vm_class = VM_TYPES[self.settings["stats"]]
+        self.client = NutanixClient.get(NUTANIX_CLUSTERS[self.settings["cluster"]])
+        self.client.register("vm", self.vm_class.STATS)
+        self.json = None
+        self.vm_basic_info = None       # The BASIC_INFO response we last updated our list of VMs from
+        self.all_vms = EntityRegistry("vm_id")
+
+    def find_by_vm_id(self, vm_id, vm_name='UNKNOWN', vm_vcpu_count=1):
+        vm = self.all_vms.get(vm_id)
+        if vm is None:
+            # if not found, create one and return it instead
+            vm = self.all_vms.add(self.vm_class(vm_id, vm_name, vm_vcpu_count, self.settings))
+        return vm
+
+    def remove_old_vms(self):
+        """Every hour we check for VMs that aren't getting updated and remove them from our list"""
+        for vm in self.all_vms:
+            if (time.time() - vm.last_updated) > 3600:
+                self.all_vms.remove(vm)
+
+    def reset(self):
+        self.vm_basic_info = None
+        self.all_vms = EntityRegistry("vm_id")
+        self.json = None
+
+
+def generate_json(monitor):
+    """
+    This function will get the VM stats for the monitor's cluster and output the busiest VMs in json format
+    in the json property.
+
+    Note that the /vms/ API returns all of the VMs with all of the data.  As of now, it doesn't have
+    a way to select which properties to return, so we just get all of them.  I decided that although this was
+    not efficient, it is still better than requesting /vms/{vmid}/stat separately for each VM.
+    """
+    logger = logging.getLogger(monitor.name)
+    # Really don't need to hear about connections being brought up again after server has closed it
+    logging.getLogger("requests.packages.urllib3.connectionpool").setLevel(logging.WARNING)
+    client = monitor.client
+
+    try:    # Try getting the vm data (the client only asks Prism for it again every FULL_UPDATE_SECONDS)
+        parameters = {'projection': 'BASIC_INFO',           # Only grab basic data, not all stats
+                      'filterCriteria': 'power_state==on'}   # Only grab powered_on vms
+        # The response is large, so it is parsed as it is downloaded and we only keep the fields we use
+        vm_basic_info = client.get_entities("/vms/", parameters, ("vmId", "vmName", "numVCpus"), FULL_UPDATE_SECONDS)
+    except Exception as error:
+        # If we couldn't connect, the client drops its session and we try again next time
+        monitor.reset()
+        logger.error("Unable to get  " + client.url + "/vms/ " + str(error))
+        monitor.json = json.dumps({"error": "Unable to get  " + client.url + "/vms/" + str(error)}, indent=4)
+        return
+
+    # The first run and every hour (when the client has a new BASIC_INFO response), remove old VMs and add new ones
+    if vm_basic_info is not monitor.vm_basic_info:
+        logger.debug("Retrieved BASIC_INFO data for " + str(len(vm_basic_info)) + " VMs")
+        # Remove old VMs
+        if monitor.vm_basic_info is not None:
+            monitor.remove_old_vms()
+
+        # Create VM objects for each VM and add them to our registry
+        for entity in vm_basic_info:
+            vm_name = entity["vmName"]
+            # Exclude any items by our list of search terms EXCLUDE_VM
+            if any(substring in vm_name for substring in EXCLUDE_VM):
+                logger.debug("Excluding: " + vm_name)
+                continue
+            # We're only interested in the last part of the entity vmID
+            # ex: 00053d1a-c9d5-958b-0000-00000000dfb7::50274c0d-5e04-3442-b47b-1c35698e3035
+            vm_id = ((entity["vmId"]).split('::'))[1]
+            # Check to see if this VM is in our list and create one if not found
+            monitor.find_by_vm_id(vm_id, vm_name, entity["numVCpus"])
+
+        monitor.vm_basic_info = vm_basic_info
+
+    try:
+        # Here we use the private API to grab only specific stats for all the VMs (shared with the other panels)
+        all_vm_stats = client.entity_stats("vm", monitor.vm_class.STATS)
+        logger.debug("Retrieved FULL data for " + str(len(all_vm_stats)) + " VMs")
+    except Exception as error:
+        # If we couldn't connect, the client drops its session and we try again next time
+        monitor.reset()
+        logger.error("Unable to get  " + client.url + "/utils/entities " + str(error))
+        monitor.json = json.dumps({"error": "Unable to get  " + client.url +
+                                            "/utils/entities " + str(error)}, indent=4)
+        return
+
+    # Loop through all the VMs and update stats
+    for entity in all_vm_stats:
+        # Get the VM object from our monitor list
+        vm = monitor.find_by_vm_id(entity["id"])
+        vm.update(entity, logger)
+
+    # ---------------------
+    # Pick the MAX_VM_RESULTS VMs with the highest relative weight.  This keeps a heap of MAX_VM_RESULTS items
+    # rather than sorting every VM (and returns all of them if there are fewer VMs than we've asked it to display).
+    top_vms = heapq.nlargest(MAX_VM_RESULTS, monitor.all_vms, key=operator.attrgetter('relative_weight'))
+
+    # Once we have finished updating our VM data, grab the top MAX_VM_RESULTS and output the JSON
+    output_vms = []
+    for vm in top_vms:
+        output_vms.append(vm.output())
+
+    monitor.json = json.dumps({"vms": output_vms})
+
+    logger.debug(monitor.json)
+
+    return monitor
+
+
+# ======================================================
+# __main__
+#
+# If you run this module by itself, it will instantiate
+# a MonitorJSON class for each panel and start an infinite loop
+# printing data.
+# ======================================================
+#
+if __name__ == '__main__':
+
+    # When run by itself, we need to create the logger object (which is normally created in webserver.py)
+    try:
+        f = open("log_settings.json", 'rt')
+        log_config = json.load(f)
+        f.close()
+        logging.config.dictConfig(log_config)
+    except FileNotFoundError as e:
+        print("Log configuration file not found: " + str(e))
+        logging.basicConfig(level=logging.DEBUG)        # fallback to basic settings
+    except json.decoder.JSONDecodeError as e:
+        print("Error parsing logger config file: " + str(e))
+        raise
+
+    test_monitors = [MonitorJSON(name) for name in INSTANCES]
+    while True:
+        main_logger = logging.getLogger(__name__)
+        for test_monitor in test_monitors:
+            generate_json(test_monitor)
+        # Wait X seconds for the next iteration
+        main_logger.debug("Waiting for " + str(SAMPLE_INTERVAL) + " seconds")
+        time.sleep(SAMPLE_INTERVAL)
@@ -3,10 +3,24 @@ Property Collector helper module.
 
 from: https://github.com/vmware/pyvmomi-community-samples/blob/master/samples/tools/pchelper.py
 
+PropertyCache was added so the modules don't have to retrieve every property of every object each time they
+collect data.  It keeps one ContainerView and one PropertyFilter per object type for as long as the connection is
+up, and uses WaitForUpdatesEx to get only the properties that have changed since the last call.
+
+Both iter_properties and PropertyCache retrieve the objects in pages of MAX_OBJECTS, so a large inventory is never
+held in one big response.
+
+PerfCollector gets real-time performance counters (cpu.ready.summation, disk.maxTotalLatency.latest, ...) from the
+PerformanceManager, with up to MAX_PERF_ENTITIES VMs or hosts in each QueryPerf call.
+
 """
 
 import pyVmomi
 
+MAX_OBJECTS = 500           # Number of objects vCenter returns in each page of results
+MAX_PERF_ENTITIES = 250     # Number of entities (VMs, hosts) in each QueryPerf call
+REALTIME_INTERVAL = 20      # The real-time performance interval (seconds)
+
 # Shamelessly borrowed from:
 # https://github.com/dnaeon/py-vconnector/blob/master/src/vconnector/core.py
 def collect_properties(service_instance, view_ref, obj_type, path_set=None,
@@ -30,9 +44,57 @@ def collect_properties(service_instance, view_ref, obj_type, path_set=None,
     Returns:
         A list of properties for the managed objects
 
+    """
+    return list(iter_properties(service_instance, view_ref, obj_type, path_set, include_mors))
+
+
+def iter_properties(service_instance, view_ref, obj_type, path_set=None,
+                    include_mors=False, max_objects=MAX_OBJECTS):
+    """
+    Generator version of collect_properties.  The objects are retrieved with
+    RetrieveContentsEx / ContinueRetrievePropertiesEx, max_objects at a time,
+    and the properties of each object are yielded as soon as its page has been
+    parsed, so the whole inventory is never in memory at once.
+
+    Args:
+        max_objects             (int): Number of objects to retrieve per page
+
+    Yields:
+        A dictionary of properties for each managed object
+
     """
     collector = service_instance.content.propertyCollector
+    filter_spec = create_filter_spec(view_ref, obj_type, path_set)
+    options = pyVmomi.vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=max_objects)
+
+    # Retrieve properties
+    result = collector.RetrieveContentsEx([filter_spec], options)
+    while result is not None:
+        try:
+            for obj in result.objects:
+                properties = {}
+                for prop in obj.propSet:
+                    properties[prop.name] = prop.val
+
+                if include_mors:
+                    properties['obj'] = obj.obj
 
+                yield properties
+        except GeneratorExit:
+            # The caller stopped early, so tell vCenter it can throw away the rest of the results
+            if result.token:
+                collector.CancelRetrievePropertiesEx(result.token)
+            raise
+
+        if not result.token:
+            break
+        result = collector.ContinueRetrievePropertiesEx(result.token)
+
+
+def create_filter_spec(view_ref, obj_type, path_set=None):
+    """
+    Create a FilterSpec for the properties in path_set of all the objects of obj_type in view_ref
+    """
     # Create object specification to define the starting point of
     # inventory navigation
     obj_spec = pyVmomi.vmodl.query.PropertyCollector.ObjectSpec()
@@ -61,21 +123,7 @@ def collect_properties(service_instance, view_ref, obj_type, path_set=None,
     filter_spec = pyVmomi.vmodl.query.PropertyCollector.FilterSpec()
     filter_spec.objectSet = [obj_spec]
     filter_spec.propSet = [property_spec]
-
-    # Retrieve properties
-    props = collector.RetrieveContents([filter_spec])
-
-    data = []
-    for obj in props:
-        properties = {}
-        for prop in obj.propSet:
-            properties[prop.name] = prop.val
-
-        if include_mors:
-            properties['obj'] = obj.obj
-
-        data.append(properties)
-    return data
+    return filter_spec
 
 
 def get_container_view(service_instance, obj_type, container=None):
@@ -101,3 +149,171 @@ def get_container_view(service_instance, obj_type, container=None):
         recursive=True
     )
     return view_ref
+
+
+class PropertyCache:
+    """
+    Keep an up to date copy of the properties in path_set for all objects of obj_type.
+
+    The first call to update() retrieves everything.  After that, vCenter only sends the objects and properties
+    that have changed (WaitForUpdatesEx), so large inventories aren't retrieved and parsed in full each time.
+
+    The ContainerView, PropertyCollector and PropertyFilter are created once and kept.  If an update fails (for
+    example the session expired), they are thrown away and created again on the next call to update().
+
+    Args:
+        si          (ServiceInstance): ServiceInstance connection
+        obj_type      (pyVmomi.vim.*): Type of managed object
+        path_set               (list): List of properties to retrieve
+        max_objects             (int): Number of objects vCenter sends per page of updates
+    """
+
+    def __init__(self, service_instance, obj_type, path_set, max_objects=MAX_OBJECTS):
+        self.service_instance = service_instance
+        self.obj_type = obj_type
+        self.path_set = path_set
+        self.max_objects = max_objects
+        self.objects = {}           # moId -> dictionary of properties (including 'obj', the managed object ref)
+        self._view_ref = None
+        self._collector = None
+        self._version = ""
+
+    def _create(self):
+        content = self.service_instance.content
+        self._view_ref = get_container_view(self.service_instance, obj_type=[self.obj_type])
+        # Use our own PropertyCollector so our filter and version don't interfere with anyone else's
+        self._collector = content.propertyCollector.CreatePropertyCollector()
+        self._collector.CreateFilter(create_filter_spec(self._view_ref, self.obj_type, self.path_set),
+                                     partialUpdates=True)
+        self._version = ""
+        self.objects = {}
+
+    def destroy(self):
+        """Destroy the PropertyCollector (and its filter) and the ContainerView on the vCenter server."""
+        for server_object in (self._collector, self._view_ref):
+            if server_object is not None:
+                try:
+                    server_object.Destroy()
+                except Exception:
+                    pass        # The session is probably gone, in which case vCenter has cleaned up already
+        self._collector = None
+        self._view_ref = None
+        self._version = ""
+        self.objects = {}
+
+    def update(self):
+        """
+        Get the changes since the last update and return a list of properties for the managed objects (the
+        same as collect_properties with include_mors=True)
+        """
+        if self._collector is None:
+            self._create()
+
+        try:
+            # maxWaitSeconds=0 returns straight away (None if nothing has changed).  Each page of updates is
+            # applied to our copy before the next one is requested.
+            options = pyVmomi.vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0,
+                                                                        maxObjectUpdates=self.max_objects)
+            while True:
+                update_set = self._collector.WaitForUpdatesEx(self._version, options)
+                if update_set is None:
+                    break
+                self._version = update_set.version
+                for filter_update in update_set.filterSet:
+                    for object_update in filter_update.objectSet:
+                        self._apply(object_update)
+                if not update_set.truncated:
+                    break
+        except Exception:
+            self.destroy()
+            raise
+
+        return list(self.objects.values())
+
+    def _apply(self, object_update):
+        mo_id = object_update.obj._moId
+        if object_update.kind == "leave":
+            self.objects.pop(mo_id, None)
+            return
+
+        # Changes are made to a copy, so a list returned by an earlier update() is never modified
+        properties = dict(self.objects.get(mo_id, {'obj': object_update.obj}))
+        for change in object_update.changeSet:
+            if change.op in ("remove", "indirectRemove"):
+                properties.pop(change.name, None)
+            else:
+                properties[change.name] = change.val
+        self.objects[mo_id] = properties
+
+
+class PerfCollector:
+    """
+    Get the latest value of performance counters for many entities at once.
+
+    Counters are named "group.counter.rollup" as they are in the vSphere client, for example
+    "cpu.ready.summation", "cpu.usagemhz.average", "disk.maxTotalLatency.latest" or "net.usage.average".  The map
+    of counter names to counter IDs is read from vCenter the first time it is needed and cached.
+
+    One PerfQuerySpec is created per entity, and up to max_entities specs are sent in each QueryPerf call, so
+    thousands of VMs only take a handful of calls.
+
+    Args:
+        si          (ServiceInstance): ServiceInstance connection
+        interval_id             (int): Sampling interval (20 = real-time stats from the host)
+        max_entities            (int): Number of entities in each QueryPerf call
+    """
+
+    def __init__(self, service_instance, interval_id=REALTIME_INTERVAL, max_entities=MAX_PERF_ENTITIES):
+        self.perf_manager = service_instance.content.perfManager
+        self.interval_id = interval_id
+        self.max_entities = max_entities
+        self._counter_ids = None        # "group.counter.rollup" -> counter ID
+
+    def counter_ids(self):
+        """Returns the (cached) map of counter names to counter IDs"""
+        if self._counter_ids is None:
+            counter_ids = {}
+            for counter in self.perf_manager.perfCounter:
+                name = counter.groupInfo.key + "." + counter.nameInfo.key + "." + str(counter.rollupType)
+                counter_ids[name] = counter.key
+            self._counter_ids = counter_ids
+        return self._counter_ids
+
+    def query(self, entities, counter_names, instance=""):
+        """
+        Get the latest sample of each counter for each of the entities.
+
+        Args:
+            entities               (list): Managed object refs of the VMs or hosts
+            counter_names          (list): Counter names ("cpu.ready.summation")
+            instance                (str): Counter instance ("" is the total for the entity, "*" is every instance)
+
+        Returns:
+            A dictionary of {moId: {counter name: value}}.  Entities without stats (powered off VMs) are left out,
+            as are counters that had no sample (or only -1, which vSphere returns for a missing sample).
+        """
+        counter_ids = self.counter_ids()
+        names_by_id = {}
+        metric_ids = []
+        for name in counter_names:
+            if name not in counter_ids:
+                raise ValueError("Unknown performance counter: " + name)
+            names_by_id[counter_ids[name]] = name
+            metric_ids.append(pyVmomi.vim.PerformanceManager.MetricId(counterId=counter_ids[name], instance=instance))
+
+        entities = list(entities)
+        results = {}
+        for start in range(0, len(entities), self.max_entities):
+            query_specs = [pyVmomi.vim.PerformanceManager.QuerySpec(entity=entity, metricId=metric_ids,
+                                                                    intervalId=self.interval_id, maxSample=1)
+                           for entity in entities[start:start + self.max_entities]]
+            for entity_metric in self.perf_manager.QueryPerf(querySpec=query_specs) or []:
+                values = {}
+                for series in entity_metric.value:
+                    # vSphere returns -1 when a sample isn't available, so use the last real one (if any)
+                    samples = [value for value in series.value if value >= 0]
+                    if samples:
+                        values[names_by_id[series.id.counterId]] = samples[-1]
+                if values:
+                    results[entity_metric.entity._moId] = values
+        return results
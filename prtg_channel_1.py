@@ -6,8 +6,9 @@ prtg_interface module which only returns the Traffic Total (via lastvalue).
 
 NOTES:
 * PRTG API is GET only and doesn't use sessions, so we pass the username and passhash on each connection.
-* We're using the table.json function to retrieve multiple sensor values at once. We filter the results by
-using a tag we've assigned to the sensors in PRTG called "statusboard_wan."
+* The requests go through prtg_client, which keeps the connections to PRTG alive between requests.  PRTG only
+returns the channels of one sensor per table.json call, so the calls for all of the sensors are sent at the same
+time (and take about as long as a single call).
 
 * The JSON output from this module is still formatted in the old iPad Statusboard app format:
 
@@ -23,11 +24,11 @@ using a tag we've assigned to the sensors in PRTG called "statusboard_wan."
 import time
 import json
 import logging.config
-import requests
 from credentials import PRTG_USERNAME
 from credentials import PRTG_PASSHASH
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from prtg_client import PRTGClient
+from prtg_client import history_values
+from timeseries import TimeSeries
 
 
 __author__ = 'scott@flakshack.com (Scott Vintinner)'
@@ -36,9 +37,8 @@ __author__ = 'scott@flakshack.com (Scott Vintinner)'
 MAX_DATAPOINTS = 120
 SAMPLE_INTERVAL = 15
 GRAPH_TITLE = "Internet (mbps)"
-PRTG_AUTH = "&username=" + PRTG_USERNAME + "&passhash=" + PRTG_PASSHASH
-PRTG_URL = ("https://prtg/api/table.json?" +
-            "content=channels&columns=name,objid,lastvalue&id=")
+PRTG_URL = "https://prtg"
+BACKFILL_HISTORY = True         # Fill the graph from PRTG's historic data at startup (so it isn't empty)
 
 # #### PRTG CHANNELS #####
 # id:  This is the PRTG sensor ID (displayed on the sensor web page or URL)
@@ -55,6 +55,7 @@ class MonitorJSON:
     """This is a simple class passed to Monitor threads so we can access the current JSON data in that thread"""
     def __init__(self):
         self.json = output_message("Loading...", "")
+        self.history_loaded = False     # We only backfill once (not again after an error resets the sensors)
 
 
 class PRTGSensor:
@@ -64,8 +65,8 @@ class PRTGSensor:
     def __init__(self, sensor_id, sensor_name):
         self.objid = sensor_id
         self.name = sensor_name
-        self.send_datapoints = []                   # Hold raw values for "Traffic Out"
-        self.receive_datapoints = []                # Hold raw values for "Traffic In"
+        self.send_datapoints = TimeSeries(MAX_DATAPOINTS)       # Hold raw values for "Traffic Out"
+        self.receive_datapoints = TimeSeries(MAX_DATAPOINTS)    # Hold raw values for "Traffic In"
         self.__class__.all_sensors.append(self)     # Add self to static array
 
 
@@ -77,10 +78,6 @@ class PRTGPausedException(Exception):
         return repr(self.value)
 
 
-class PRTGRequestException(Exception):
-    pass
-
-
 def output_message(message, detail):
     """This function will output an error message formatted in JSON to display on the StatusBoard app"""
     statusbar_output = {"graph": {"title": GRAPH_TITLE, "error": {"message": message, "detail": detail}}}
@@ -88,29 +85,50 @@ def output_message(message, detail):
     return output
 
 
+def backfill_history(prtg, logger):
+    """Fill the sensors' datapoints from PRTG's historic data for the time the graph covers.  If PRTG doesn't
+    return the history, we just start with an empty graph."""
+    try:
+        history = prtg.get_history([sensor.objid for sensor in PRTGSensor.all_sensors],
+                                   MAX_DATAPOINTS * SAMPLE_INTERVAL)
+    except Exception as error:
+        logger.warning("Unable to get PRTG historic data: " + str(error))
+        return
+
+    for sensor in PRTGSensor.all_sensors:
+        # The raw speed is the same bytes per second as lastvalue_raw (see below)
+        for timestamp, raw in history_values(history[sensor.objid], "Traffic In (speed)")[-MAX_DATAPOINTS:]:
+            sensor.receive_datapoints.append(round((raw*8)/1000000, 2), timestamp)
+        for timestamp, raw in history_values(history[sensor.objid], "Traffic Out (speed)")[-MAX_DATAPOINTS:]:
+            sensor.send_datapoints.append(round((raw*8)/1000000, 2), timestamp)
+        logger.debug("Loaded " + str(len(sensor.receive_datapoints)) + " historic datapoints for " + sensor.name)
+
+
 def generate_json(prtg_monitor):
     """This function will connect to the PRTG server API and store the output in prtg_monitor.json"""
 
     logger = logging.getLogger("prtg_channel_1")
-    time_x_axis = time.strftime("%H:%M")  # The time that we'll add to the X axis of the chart
+    sample_time = time.time()  # The time that we'll add to the X axis of the chart
 
     # Create a list of PRTGSensors using the contants provided above (we'll store the data in this object)
-    if len(PRTGSensor.all_sensors) == 0:    # This is only done once
+    if len(PRTGSensor.all_sensors) == 0:    # This is only done once (or after an error)
         for sensor in PRTG_SENSORS:
             PRTGSensor(sensor["objid"], sensor["name"])
 
     try:
+        prtg = PRTGClient.get(PRTG_URL, PRTG_USERNAME, PRTG_PASSHASH)
+        # historicdata is PRTG's most expensive call, so this is only tried once, even if it fails
+        if BACKFILL_HISTORY and not prtg_monitor.history_loaded:
+            prtg_monitor.history_loaded = True
+            backfill_history(prtg, logger)
 
-        # Loop through our list of targets and grab the data from PRTG
-        for sensor in PRTGSensor.all_sensors:
-            # ############ PRTG API CALL ###############
-            logger.debug("Getting: " + PRTG_URL + str(sensor.objid))
-            r = requests.get(PRTG_URL + str(sensor.objid) + PRTG_AUTH, verify=False)
-            if r.status_code != 200:
-                raise PRTGRequestException("Request error status: " + str(r.status_code) + " " + r.reason)
-            json_data = r.json()  # Convert returned byte stream to json
+        # ############ PRTG API CALL ###############
+        # Get the channels for all of our sensors at once
+        all_channels = prtg.get_channels([sensor.objid for sensor in PRTGSensor.all_sensors])
 
-            for api_channel in json_data["channels"]:
+        # Loop through our list of targets and grab their data
+        for sensor in PRTGSensor.all_sensors:
+            for api_channel in all_channels[sensor.objid]:
 
                 if api_channel["name"] == "Traffic In":
                     if api_channel['lastvalue'] == '-':
@@ -121,11 +139,7 @@ def generate_json(prtg_monitor):
                     # The conversion from raw to mbps is lastvalue_raw*8/(1000*1000)
                     # Note we're using SI (decimal) notation here because that is what PRTG uses.
                     mbps = round(((api_channel["lastvalue_raw"])*8)/1000000, 2)  # Convert from PRTG raw to mbps
-                    sensor.receive_datapoints.append({"title": time_x_axis, "value": mbps})
-
-                    # If we already have the max number of datapoints, delete the oldest item.
-                    if len(sensor.receive_datapoints) >= MAX_DATAPOINTS:
-                        del(sensor.receive_datapoints[0])
+                    sensor.receive_datapoints.append(mbps, sample_time)
                 elif api_channel["name"] == "Traffic Out":
                     if api_channel['lastvalue'] == '-':
                         raise PRTGPausedException(sensor.name + ' Traffic Out')
@@ -135,17 +149,13 @@ def generate_json(prtg_monitor):
                     # The conversion from raw to mbps is lastvalue_raw*8/(1000*1000)
                     # Note we're using SI (decimal) notation here because that is what PRTG uses.
                     mbps = round(((api_channel["lastvalue_raw"])*8)/1000000, 2)  # Convert from PRTG raw to mbps
-                    sensor.send_datapoints.append({"title": time_x_axis, "value": mbps})
-
-                    # If we already have the max number of datapoints, delete the oldest item.
-                    if len(sensor.send_datapoints) >= MAX_DATAPOINTS:
-                        del(sensor.send_datapoints[0])
+                    sensor.send_datapoints.append(mbps, sample_time)
 
         # #### Format the JSON data that is expected by the javascript front-end #####
         statusbar_datasequences = []
         for sensor in PRTGSensor.all_sensors:
-            statusbar_datasequences.append({"title": sensor.name + " TX", "datapoints": sensor.send_datapoints})
-            statusbar_datasequences.append({"title": sensor.name + " RX", "datapoints": sensor.receive_datapoints})
+            statusbar_datasequences.append({"title": sensor.name + " TX", "datapoints": sensor.send_datapoints.datapoints()})
+            statusbar_datasequences.append({"title": sensor.name + " RX", "datapoints": sensor.receive_datapoints.datapoints()})
 
         statusbar_graph = {
             "title": GRAPH_TITLE, "type": "line",
@@ -0,0 +1,123 @@
+"""prtg_client - Shared PRTG API client used by the prtg modules.
+
+The PRTG API is GET only and doesn't use sessions, so the username and passhash are passed on each request.  Each
+PRTG server gets a single PRTGClient (use PRTGClient.get) with one requests.Session and a pool of kept-alive
+connections, so the modules don't open a new TCP connection (and TLS handshake) for every request.
+
+* get_sensors() returns the sensor table (content=sensors) for any number of sensors in a single request, filtered
+  by tag and/or by objid.
+* get_channels(objids) returns the channel table (content=channels) of several sensors.  PRTG only returns the
+  channels of one sensor per request, so these requests are all sent at the same time over the connection pool,
+  and the result takes about as long as a single request no matter how many sensors there are.
+* get_history(objids, seconds) returns the recent history of several sensors from historicdata.json (one request
+  per sensor, sent at the same time), so the modules can fill their graphs when they start.  Use history_values()
+  to read one channel from it.
+
+    prtg = PRTGClient.get("https://prtg", PRTG_USERNAME, PRTG_PASSHASH)
+    channels = prtg.get_channels([7800, 7799])         # {7800: [{"name": "Traffic In", ...}, ...], 7799: [...]}
+    sensors = prtg.get_sensors(filter_tags="statusboard_wan1")
+    history = prtg.get_history([7800, 7799], 1800)     # The last 30 minutes
+    traffic_in = history_values(history[7800], "Traffic In (speed)")    # [(time, raw value), ...]
+
+"""
+import concurrent.futures
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+__author__ = 'scott@flakshack.com (Scott Vintinner)'
+
+# =================================SETTINGS======================================
+MAX_PARALLEL_REQUESTS = 8       # How many requests we send to a PRTG server at the same time (and pooled connections)
+HISTORY_DATE_FORMAT = "%Y-%m-%d-%H-%M-%S"   # sdate/edate format for historicdata (in the PRTG server's local time)
+OLE_DATE_EPOCH = 25569          # datetime_raw is an OLE date (days since 1899-12-30); this is 1970-01-01
+# ===============================================================================
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS)
+
+
+class PRTGRequestException(Exception):
+    pass
+
+
+class PRTGClient:
+    """A single PRTG server.  Use PRTGClient.get() so every module shares the same connection pool."""
+    all_clients = {}                    # (url, username) -> PRTGClient
+    _all_clients_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, url, username, passhash):
+        """Returns the shared PRTGClient for this PRTG server (ex: https://prtg) and username."""
+        key = (url, username)
+        with cls._all_clients_lock:
+            if key not in cls.all_clients:
+                cls.all_clients[key] = cls(url, username, passhash)
+            return cls.all_clients[key]
+
+    def __init__(self, url, username, passhash):
+        self.url = url
+        self.session = requests.Session()
+        # Keep enough connections in the pool for all of the requests we send at the same time
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_PARALLEL_REQUESTS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.verify = False         # Ignore certificate errors
+        self.auth = [("username", username), ("passhash", passhash)]       # Added to every request
+
+    def get_json(self, path, parameters=()):
+        """Returns the decoded JSON from url + path.  parameters is a list of (name, value) pairs, since PRTG
+        filters can be repeated.  Raises PRTGRequestException for an error status."""
+        logger = logging.getLogger(__name__)
+        logger.debug("Getting: " + self.url + path + " " + str(parameters))
+        r = self.session.get(self.url + path, params=list(parameters) + self.auth)
+        if r.status_code != 200:
+            raise PRTGRequestException("Request error status: " + str(r.status_code) + " " + r.reason)
+        return r.json()
+
+    def get_sensors(self, columns="objid,lastvalue", filter_tags=None, objids=()):
+        """Returns the list of sensors (content=sensors) with the tag filter_tags and/or the listed objids."""
+        parameters = [("content", "sensors"), ("columns", columns)]
+        if filter_tags is not None:
+            parameters.append(("filter_tags", "@tag(" + filter_tags + ")"))
+        for objid in objids:
+            parameters.append(("filter_objid", objid))
+        return self.get_json("/api/table.json", parameters)["sensors"]
+
+    def get_channels(self, objids, columns="name,objid,lastvalue"):
+        """Returns {objid: list of channels} for each of the sensors.  The requests are sent at the same time."""
+        futures = {}
+        for objid in objids:
+            parameters = [("content", "channels"), ("columns", columns), ("id", objid)]
+            futures[objid] = _executor.submit(self.get_json, "/api/table.json", parameters)
+        return {objid: future.result()["channels"] for objid, future in futures.items()}
+
+    def get_history(self, objids, seconds, average=0):
+        """Returns {objid: list of historic data rows} covering the last seconds for each of the sensors.  average
+        is PRTG's averaging interval in seconds (0 for the raw scans).  The requests are sent at the same time."""
+        now = time.time()
+        start_date = time.strftime(HISTORY_DATE_FORMAT, time.localtime(now - seconds))
+        end_date = time.strftime(HISTORY_DATE_FORMAT, time.localtime(now))
+        futures = {}
+        for objid in objids:
+            parameters = [("id", objid), ("avg", average), ("sdate", start_date), ("edate", end_date),
+                          ("usecaption", 1)]
+            futures[objid] = _executor.submit(self.get_json, "/api/historicdata.json", parameters)
+        return {objid: future.result()["histdata"] for objid, future in futures.items()}
+
+
+def history_values(rows, column):
+    """Returns a list of (epoch time, raw value) for one column of get_history rows (ex: "Traffic In (speed)"),
+    oldest first.  Rows without a value for the column (no data for that interval) are skipped."""
+    values = []
+    for row in rows:
+        value = row.get(column + "_raw", row.get(column + "(RAW)"))
+        if value is None or value == "":
+            continue
+        timestamp = (float(row["datetime_raw"]) - OLE_DATE_EPOCH) * 86400
+        values.append((timestamp, float(value)))
+    values.sort(key=lambda item: item[0])
+    return values
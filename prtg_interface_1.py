@@ -5,6 +5,7 @@ NOTES:
 * PRTG API is GET only and doesn't use sessions, so we pass the username and passhash on each connection.
 * We're using the table.json function to retrieve multiple sensor values at once. We filter the results by
 using a tag we've assigned to the sensors in PRTG called "statusboard_wan."
+* The requests go through prtg_client, which keeps the connections to PRTG alive between requests.
 
 * The JSON output from this module is still formatted in the old iPad Statusboard app format:
 
@@ -20,11 +21,11 @@ using a tag we've assigned to the sensors in PRTG called "statusboard_wan."
 import time
 import json
 import logging.config
-import requests
 from credentials import PRTG_USERNAME
 from credentials import PRTG_PASSHASH
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from prtg_client import PRTGClient
+from prtg_client import history_values
+from timeseries import TimeSeries
 
 
 __author__ = 'scott@flakshack.com (Scott Vintinner)'
@@ -33,9 +34,10 @@ __author__ = 'scott@flakshack.com (Scott Vintinner)'
 MAX_DATAPOINTS = 120
 SAMPLE_INTERVAL = 15
 GRAPH_TITLE = "WAN (mbps)"
-PRTG_AUTH = "&username=" + PRTG_USERNAME + "&passhash=" + PRTG_PASSHASH
-PRTG_URL = ("https://prtg/api/table.json?" +
-            "content=sensors&columns=objid,lastvalue&filter_tags=@tag(statusboard_wan1)")
+PRTG_URL = "https://prtg"
+PRTG_TAG = "statusboard_wan1"      # Tag we've assigned to the sensors in PRTG
+BACKFILL_HISTORY = True         # Fill the graph from PRTG's historic data at startup (so it isn't empty)
+HISTORY_CHANNEL = "Traffic Total (speed)"   # The historic data column for the sensor's lastvalue (primary channel)
 
 # #### PRTG SENSORS #####
 # The sensors are retrieved by a tag filter, but we'll use this list to help name them.
@@ -55,6 +57,7 @@ class MonitorJSON:
     """This is a simple class passed to Monitor threads so we can access the current JSON data in that thread"""
     def __init__(self):
         self.json = output_message("Loading...", "")
+        self.history_loaded = False     # We only backfill once (not again after an error resets the sensors)
 
 
 class PRTGSensor:
@@ -64,7 +67,7 @@ class PRTGSensor:
     def __init__(self, sensor_id, sensor_name):
         self.objid = sensor_id
         self.name = sensor_name
-        self.datapoints = []                 # Hold raw values from PRTG
+        self.datapoints = TimeSeries(MAX_DATAPOINTS)     # Hold raw values from PRTG
         self.__class__.all_sensors.append(self)     # Add self to static array
 
 
@@ -76,10 +79,6 @@ class PRTGPausedException(Exception):
         return repr(self.value)
 
 
-class PRTGRequestException(Exception):
-    pass
-
-
 def output_message(message, detail):
     """This function will output an error message formatted in JSON to display on the StatusBoard app"""
     statusbar_output = {"graph": {"title": GRAPH_TITLE, "error": {"message": message, "detail": detail}}}
@@ -87,29 +86,48 @@ def output_message(message, detail):
     return output
 
 
+def backfill_history(prtg, logger):
+    """Fill the sensors' datapoints from PRTG's historic data for the time the graph covers.  If PRTG doesn't
+    return the history, we just start with an empty graph."""
+    try:
+        history = prtg.get_history([sensor.objid for sensor in PRTGSensor.all_sensors],
+                                   MAX_DATAPOINTS * SAMPLE_INTERVAL)
+    except Exception as error:
+        logger.warning("Unable to get PRTG historic data: " + str(error))
+        return
+
+    for sensor in PRTGSensor.all_sensors:
+        # The raw speed is the same bytes per second as lastvalue_raw (see below)
+        for timestamp, raw in history_values(history[sensor.objid], HISTORY_CHANNEL)[-MAX_DATAPOINTS:]:
+            sensor.datapoints.append(round((raw*8)/1000000, 2), timestamp)
+        logger.debug("Loaded " + str(len(sensor.datapoints)) + " historic datapoints for " + sensor.name)
+
+
 def generate_json(prtg_monitor):
     """This function will connect to the PRTG server API and store the output in prtg_monitor.json"""
 
     logger = logging.getLogger("prtg_interface_1")
-    time_x_axis = time.strftime("%H:%M")  # The time that we'll add to the X axis of the chart
+    sample_time = time.time()  # The time that we'll add to the X axis of the chart
 
     # Create a list of PRTGSensors using the contants provided above (we'll store the data in this object)
-    if len(PRTGSensor.all_sensors) == 0:    # This is only done once
+    if len(PRTGSensor.all_sensors) == 0:    # This is only done once (or after an error)
         for sensor in PRTG_SENSORS:
             PRTGSensor(sensor["objid"], sensor["name"])
 
     try:
+        prtg = PRTGClient.get(PRTG_URL, PRTG_USERNAME, PRTG_PASSHASH)
+        # historicdata is PRTG's most expensive call, so this is only tried once, even if it fails
+        if BACKFILL_HISTORY and not prtg_monitor.history_loaded:
+            prtg_monitor.history_loaded = True
+            backfill_history(prtg, logger)
+
         # ############ PRTG API CALL ###############
-        logger.debug("Getting: " + PRTG_URL)
-        r = requests.get(PRTG_URL + PRTG_AUTH, verify=False)
-        if r.status_code != 200:
-            raise PRTGRequestException("Request error status: " + str(r.status_code) + " " + r.reason)
-        api_data = r.json()  # Convert returned byte stream to json
+        api_sensors = prtg.get_sensors("objid,lastvalue", filter_tags=PRTG_TAG)
 
         # Loop through our list of sensors, match the object id with the item returned by the API call
         # and add a datapoint to our array.
         for sensor in PRTGSensor.all_sensors:
-            for api_sensor in api_data["sensors"]:
+            for api_sensor in api_sensors:
                 if api_sensor['lastvalue'] == '-':
                     raise PRTGPausedException(sensor.name)
                 if sensor.objid == api_sensor["objid"]:
@@ -118,16 +136,12 @@ def generate_json(prtg_monitor):
                     # The conversion from raw to mbps is lastvalue_raw*8/(1000*1000)
                     # Note we're using SI (decimal) notation here because that is what PRTG uses.
                     mbps = round(((api_sensor["lastvalue_raw"])*8)/1000000, 2)  # Convert from PRTG raw to mbps
-                    sensor.datapoints.append({"title": time_x_axis, "value": mbps})
-
-                    # If we already have the max number of datapoints, delete the oldest item.
-                    if len(sensor.datapoints) >= MAX_DATAPOINTS:
-                        del(sensor.datapoints[0])
+                    sensor.datapoints.append(mbps, sample_time)
 
         # #### Format the JSON data that is expected by the javascript front-end #####
         statusbar_datasequences = []
         for sensor in PRTGSensor.all_sensors:
-            statusbar_datasequences.append({"title": sensor.name, "datapoints": sensor.datapoints})
+            statusbar_datasequences.append({"title": sensor.name, "datapoints": sensor.datapoints.datapoints()})
 
         statusbar_graph = {
             "title": GRAPH_TITLE, "type": "line",
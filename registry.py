@@ -0,0 +1,119 @@
+"""registry - Keyed collections for the objects (VMs, hosts, ...) that the data modules keep between collections.
+
+The modules used to keep their VMs and hosts in a plain list and scan it to find a match for every property set
+returned by the API, which makes each collection O(N^2) in the size of the inventory.  An EntityRegistry keeps the
+same objects in dictionaries instead, so each lookup is O(1) and a collection is linear.
+
+Every entity has a primary key attribute (a vSphere managed object reference, a Nutanix vmId, ...) and can also be
+indexed by other attributes such as its name.  The objects themselves stay in the registry from one collection to
+the next, so their histories (TimeSeries, relative_weight, ...) are kept.
+
+The registry also tracks a generation number that the module advances once per collection.  Every entity that is
+added or marked with seen() is stamped with the current generation, and evict() removes the entities that haven't
+been seen for a number of generations (VMs that were deleted, hosts that were removed from vCenter), so the
+registry doesn't grow for as long as the server is running.
+
+    all_vms = EntityRegistry("managed_object_reference", "name")
+    vm = all_vms.get(mor) or all_vms.find("name", vm_name)
+    if vm is None:
+        vm = all_vms.add(VMwareVM(mor, vm_name))
+    all_vms.set(vm, "name", new_name)       # Change an indexed attribute and update the index
+
+    all_vms.next_generation()               # At the start of each collection
+    all_vms.seen(vm)                        # For each entity returned by the API
+    all_vms.evict(MAX_MISSED_COLLECTIONS)   # At the end of a successful collection
+
+"""
+
+__author__ = 'scott@flakshack.com (Scott Vintinner)'
+
+
+def entity_key(value):
+    """Returns a hashable key for value.  pyVmomi managed object references are keyed by the vCenter they came
+    from and their moId (so "host-12" from two different vCenter servers doesn't collide)."""
+    if hasattr(value, "_moId"):
+        return getattr(value, "_serverGuid", None), value._moId
+    return value
+
+
+class EntityRegistry:
+    """A collection of entities indexed by their key attribute and any number of other attributes."""
+
+    def __init__(self, key_attribute, *index_attributes):
+        self.key_attribute = key_attribute
+        self.index_attributes = index_attributes
+        self._entities = {}                                         # key -> entity
+        self._indexes = {attribute: {} for attribute in index_attributes}   # attribute -> {value -> entity}
+        self._last_seen = {}                                        # key -> generation the entity was last seen
+        self.generation = 0
+
+    def get(self, key):
+        """Returns the entity with this key (or None)."""
+        return self._entities.get(entity_key(key))
+
+    def find(self, attribute, value):
+        """Returns the entity whose indexed attribute has this value (or None)."""
+        return self._indexes[attribute].get(entity_key(value))
+
+    def add(self, entity):
+        """Adds the entity (replacing any entity with the same key) and returns it."""
+        old_entity = self.get(getattr(entity, self.key_attribute))
+        if old_entity is not None:
+            self.remove(old_entity)
+        key = entity_key(getattr(entity, self.key_attribute))
+        self._entities[key] = entity
+        self._last_seen[key] = self.generation
+        for attribute, index in self._indexes.items():
+            index[entity_key(getattr(entity, attribute))] = entity
+        return entity
+
+    def remove(self, entity):
+        """Removes the entity from the registry (if it is in it)."""
+        key = entity_key(getattr(entity, self.key_attribute))
+        if self._entities.get(key) is entity:
+            del self._entities[key]
+            del self._last_seen[key]
+        for attribute, index in self._indexes.items():
+            value = entity_key(getattr(entity, attribute))
+            if index.get(value) is entity:
+                del index[value]
+
+    def set(self, entity, attribute, value):
+        """Changes an attribute of the entity, updating the index for it (if there is one)."""
+        if getattr(entity, attribute) == value:
+            return
+        self.remove(entity)
+        setattr(entity, attribute, value)
+        self.add(entity)
+
+    def next_generation(self):
+        """Starts a new generation (call once at the start of each collection)."""
+        self.generation += 1
+        return self.generation
+
+    def seen(self, entity):
+        """Stamps the entity with the current generation and returns it."""
+        self._last_seen[entity_key(getattr(entity, self.key_attribute))] = self.generation
+        return entity
+
+    def evict(self, max_missed_generations):
+        """Removes the entities that haven't been seen for more than max_missed_generations generations and
+        returns them."""
+        oldest = self.generation - max_missed_generations
+        evicted = [self._entities[key] for key, generation in self._last_seen.items() if generation < oldest]
+        for entity in evicted:
+            self.remove(entity)
+        return evicted
+
+    def clear(self):
+        self._entities.clear()
+        self._last_seen.clear()
+        for index in self._indexes.values():
+            index.clear()
+
+    def __len__(self):
+        return len(self._entities)
+
+    def __iter__(self):
+        # Iterate over a copy so the caller can remove entities as it goes
+        return iter(list(self._entities.values()))
@@ -12,9 +12,12 @@ expect them to break each time you upgrade. :-)
 """
 import json
 import time
+import concurrent.futures
 import requests
 import logging.config
 from requests.auth import HTTPBasicAuth
+from timeseries import TimeSeries, json_default
+from ttlcache import shared_cache
 from credentials import RUBRIK_USER  # Login info now stored in credentials.py
 from credentials import RUBRIK_PASSWORD  # Login info now stored in credentials.py
 
@@ -24,8 +27,32 @@ __author__ = 'scott@flakshack.com (Scott Vintinner)'
 RUBRIK_URL = "https://<IP of your Rubrik>"
 SAMPLE_INTERVAL = 60
 MAX_DATAPOINTS = 30
+MAX_PARALLEL_REQUESTS = 8       # How many of the endpoints we request at the same time
+
+# The endpoints we read each interval (the summary report is requested separately, since we need its ID first)
+ENDPOINTS = {
+    "system_storage": "/api/internal/stats/system_storage",
+    "snapshot_storage": "/api/internal/stats/snapshot_storage/physical",
+    "storage_growth": "/api/internal/stats/average_storage_growth_per_day",
+    # The values returned with -1day are different than when using -2day or higher (and they seem wrong)
+    # So we pull in the values for -2day instead.
+    "ingest_per_day": "/api/internal/stats/physical_ingest_per_day/time_series?range=-2day",
+    "node": "/api/internal/cluster/me/node",
+    "streams": "/api/internal/stats/streams/count",
+    "io_stats": "/api/internal/cluster/me/io_stats?range=-30min",
+    "physical_ingest": "/api/internal/stats/physical_ingest/time_series?range=-30min"
+}
+# Data that changes slowly is only requested this often (seconds).  In between, the value is served from the
+# shared cache (see ttlcache.py).  Anything not listed is requested every SAMPLE_INTERVAL.
+REFRESH_INTERVALS = {
+    "report_id": 86400,             # ID of the Protection Tasks Details report
+    "storage_growth": 3600          # avg_growth_per_day
+}
+# ingest_per_day isn't listed: the same response has ingested_today, a running daily total we want every interval
 # ===============================================================================
 
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS)
+
 
 class RubrikData:
     """This class will contain all of the data gathered during processing"""
@@ -33,7 +60,7 @@ class RubrikData:
         self.iops = []
         self.throughput = []
         self.ingest = []
-        self.streams = []
+        self.streams = TimeSeries(MAX_DATAPOINTS, "q")
         self.success_count = 0
         self.failure_count = 0
         self.running_count = 0
@@ -57,7 +84,6 @@ class MonitorJSON:
         self.session = None
         self.data = RubrikData()
         self.token = None
-        self.detail_report_id = None
 
 
 def get_rubrik_token(rubrik_monitor):
@@ -98,6 +124,35 @@ def get_rubrik_token(rubrik_monitor):
         return None
 
 
+def get_endpoint(session, endpoint, headers):
+    """Requests one endpoint and returns the decoded JSON."""
+    r = session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
+    if r.status_code != 200:
+        raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
+    return r.json()
+
+
+def get_cached_endpoint(name, session, headers):
+    """Returns the decoded JSON from ENDPOINTS[name], from the shared cache if it was requested within the
+    REFRESH_INTERVALS setting for name."""
+    endpoint = ENDPOINTS[name]
+    return shared_cache.get(RUBRIK_URL + endpoint, lambda: get_endpoint(session, endpoint, headers),
+                            REFRESH_INTERVALS.get(name, 0))
+
+
+def get_report_chart(session, headers):
+    """Returns the chart data of the Protection Tasks Details report."""
+    # The report structure has changed.  First we must get the ID of the report we need
+    endpoint = "/api/internal/report?report_type=Canned&search_text=Protection Tasks Details"
+    detail_report_id = shared_cache.get(RUBRIK_URL + endpoint,
+                                        lambda: get_endpoint(session, endpoint, headers)["data"][0]["id"],
+                                        REFRESH_INTERVALS.get("report_id", 0))
+
+    # Now we call the report
+    endpoint = "/api/internal/report/" + detail_report_id + "/chart?timezone_offset=0&chart_id=chart0"
+    return get_endpoint(session, endpoint, headers)
+
+
 def generate_json(rubrik_monitor):
     """This function will connect to the Rubrik web server, parse data and store the output in rubrik_monitor.json"""
 
@@ -118,22 +173,16 @@ def generate_json(rubrik_monitor):
                }
 
     try:
+        # The endpoints don't depend on each other, so we request them all at the same time over our session and
+        # wait for the slowest one.  Each response is decoded once and the data is read from the decoded JSON.
+        # The slow-changing endpoints in REFRESH_INTERVALS come from the cache between refreshes.
+        futures = {name: _executor.submit(get_cached_endpoint, name, rubrik_monitor.session, headers)
+                   for name in ENDPOINTS}
+        futures["report_chart"] = _executor.submit(get_report_chart, rubrik_monitor.session, headers)
+        results = {name: future.result() for name, future in futures.items()}
+
         # Summary Report
-        # The report structure has changed.  First we must get the ID of the report we need
-        detail_report_id = rubrik_monitor.detail_report_id
-        if detail_report_id is None:
-            endpoint = "/api/internal/report?report_type=Canned&search_text=Protection Tasks Details"
-            r = rubrik_monitor.session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
-            if r.status_code != 200:
-                raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
-            detail_report_id = rubrik_monitor.detail_report_id = json.loads(r.text)["data"][0]["id"]
-
-        # Now we call the report
-        endpoint = "/api/internal/report/" + detail_report_id + "/chart?timezone_offset=0&chart_id=chart0"
-        r = rubrik_monitor.session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
-        if r.status_code != 200:
-            raise RubrikNotConnectedException("Error getting " + endpoint + r.text)
-        chart_data = json.loads(r.text)[0]["dataColumns"]
+        chart_data = results["report_chart"][0]["dataColumns"]
         for column in chart_data:
             if column["label"] == "Succeeded":
                 rubrik_monitor.data.success_count = int(column["dataPoints"][0]["value"])
@@ -145,49 +194,28 @@ def generate_json(rubrik_monitor):
         # Storage stats
         # Note that "used" here includes system space.  We're more interested in snapshot space
         # so we'll get a used value in the next query.
-        endpoint = "/api/internal/stats/system_storage"
-        r = rubrik_monitor.session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
-        if r.status_code != 200:
-            raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
+        system_storage = results["system_storage"]
         # Grab the data and convert to gigabytes (rounding up)
-        rubrik_monitor.data.total = int(json.loads(r.text)["total"] / (1000 * 1000 * 1000))
-        rubrik_monitor.data.available = int(json.loads(r.text)["available"] / (1000 * 1000 * 1000))
+        rubrik_monitor.data.total = int(system_storage["total"] / (1000 * 1000 * 1000))
+        rubrik_monitor.data.available = int(system_storage["available"] / (1000 * 1000 * 1000))
 
         # Snapshot stats
         # For some reason this value is returned as a string by the API.
-        endpoint = "/api/internal/stats/snapshot_storage/physical"
-        r = rubrik_monitor.session.get(
-            RUBRIK_URL + endpoint, verify=False, headers=headers)
-        if r.status_code != 200:
-            raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
         # Grab the data, convert from string and convert to gigabytes (rounding up)
-        rubrik_monitor.data.used = int(int(json.loads(r.text)["value"]) / (1000 * 1000 * 1000))
+        rubrik_monitor.data.used = int(int(results["snapshot_storage"]["value"]) / (1000 * 1000 * 1000))
 
         # Average Storage Growth Per Day
-        endpoint = "/api/internal/stats/average_storage_growth_per_day"
-        r = rubrik_monitor.session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
-        if r.status_code != 200:
-            raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
         # Grab data and convert to gigabytes (rounding up)
-        rubrik_monitor.data.avg_growth_per_day = int(json.loads(r.text)["bytes"] / (1000 * 1000 * 1000))
+        rubrik_monitor.data.avg_growth_per_day = int(results["storage_growth"]["bytes"] / (1000 * 1000 * 1000))
 
         # Physical Ingest per day (each stat covers a 24 hour day)
-        # The values returned with -1day are different than when using -2day or higher (and they seem wrong)
-        # So we pull in the values for -2day instead.
-        endpoint = "/api/internal/stats/physical_ingest_per_day/time_series?range=-2day"
-        r = rubrik_monitor.session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
-        if r.status_code != 200:
-            raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
         # Grab data and convert to gigabytes (rounding up)
-        rubrik_monitor.data.ingested_yesterday = int(json.loads(r.text)[-2]["stat"] / (1000 * 1000 * 1000))
-        rubrik_monitor.data.ingested_today = int(json.loads(r.text)[-1]["stat"] / (1000 * 1000 * 1000))
+        ingest_per_day = results["ingest_per_day"]
+        rubrik_monitor.data.ingested_yesterday = int(ingest_per_day[-2]["stat"] / (1000 * 1000 * 1000))
+        rubrik_monitor.data.ingested_today = int(ingest_per_day[-1]["stat"] / (1000 * 1000 * 1000))
 
         # Node Status
-        endpoint = "/api/internal/cluster/me/node"
-        r = rubrik_monitor.session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
-        if r.status_code != 200:
-            raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
-        status_json = json.loads(r.text)
+        status_json = results["node"]
         system_status = "OK"
         for x in range(0, status_json["total"]):
             if status_json["data"][x]["status"] != "OK":
@@ -195,15 +223,8 @@ def generate_json(rubrik_monitor):
         rubrik_monitor.data.node_status = system_status
 
         # Current Streams (API returns a single value)
-        endpoint = "/api/internal/stats/streams/count"
-        r = rubrik_monitor.session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
-        if r.status_code != 200:
-            raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
-        streams = json.loads(r.text)["count"]
+        streams = results["streams"]["count"]
         rubrik_monitor.data.streams.append(streams)
-        # If we already have the max number of datapoints in our list, delete the oldest item
-        if len(rubrik_monitor.data.iops) > MAX_DATAPOINTS:
-            del (rubrik_monitor.data.streams[0])
 
         # IOPS/Throughput
         # https://support.rubrik.com/s/article/000002778
@@ -211,24 +232,24 @@ def generate_json(rubrik_monitor):
         # in real time.
         # Rather than trying to read the most recent value and add it to our own array (which would be most
         # efficient, we'll just read their array each time and replace ours.
-
-        endpoint = "/api/internal/cluster/me/io_stats?range=-30min"
-        r = rubrik_monitor.session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
-        if r.status_code != 200:
-            raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
+        io_stats = results["io_stats"]
 
         rubrik_monitor.data.iops = []
-        for i in range(len(json.loads(r.text)["iops"]["readsPerSecond"])):
+        reads_per_second = io_stats["iops"]["readsPerSecond"]
+        writes_per_second = io_stats["iops"]["writesPerSecond"]
+        for i in range(len(reads_per_second)):
             if i <= 25:   # Drop the last results since they are all zero
-                iops_reads = json.loads(r.text)["iops"]["readsPerSecond"][i]["stat"]
-                iops_writes = json.loads(r.text)["iops"]["writesPerSecond"][i]["stat"]
+                iops_reads = reads_per_second[i]["stat"]
+                iops_writes = writes_per_second[i]["stat"]
                 rubrik_monitor.data.iops.append(iops_reads + iops_writes)
 
         rubrik_monitor.data.throughput = []
-        for i in range(len(json.loads(r.text)["ioThroughput"]["readBytePerSecond"])):
+        read_bytes_per_second = io_stats["ioThroughput"]["readBytePerSecond"]
+        write_bytes_per_second = io_stats["ioThroughput"]["writeBytePerSecond"]
+        for i in range(len(read_bytes_per_second)):
             if i <= 25:  # Drop the last results since they are all zero
-                throughput_reads = json.loads(r.text)["ioThroughput"]["readBytePerSecond"][i]["stat"]
-                throughput_writes = json.loads(r.text)["ioThroughput"]["writeBytePerSecond"][i]["stat"]
+                throughput_reads = read_bytes_per_second[i]["stat"]
+                throughput_writes = write_bytes_per_second[i]["stat"]
                 # convert byte_reads from Bytes to Megabytes
                 throughput_reads = int(throughput_reads / (1024 * 1024))  # Round up
                 throughput_writes = int(throughput_writes / (1024 * 1024))  # Round up
@@ -236,20 +257,17 @@ def generate_json(rubrik_monitor):
 
         # PhysicalIngest (Live data)
         # Same issues with IO Stats above
-        endpoint = "/api/internal/stats/physical_ingest/time_series?range=-30min"
-        r = rubrik_monitor.session.get(RUBRIK_URL + endpoint, verify=False, headers=headers)
-        if r.status_code != 200:
-            raise RubrikNotConnectedException("Error getting " + endpoint + " " + r.text)
+        physical_ingest = results["physical_ingest"]
         rubrik_monitor.data.ingest = []
-        for i in range(len(json.loads(r.text))):
+        for i in range(len(physical_ingest)):
             if i <= 25:  # Drop the last results since they are all zero
-                ingest = json.loads(r.text)[i]["stat"]
+                ingest = physical_ingest[i]["stat"]
                 # convert byte_reads from Bytes to Megabytes
                 ingest = int(ingest / (1024 * 1024))  # Round up
                 rubrik_monitor.data.ingest.append(ingest)
 
         # Format our output as json under the stats name
-        output = json.dumps({"stats": rubrik_monitor.data.__dict__})
+        output = json.dumps({"stats": rubrik_monitor.data.__dict__}, default=json_default)
 
         # ====================================
         # Generate JSON output and assign to rubrik_monitor object (for return back to caller module)
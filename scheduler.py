@@ -0,0 +1,224 @@
+"""scheduler.py - Central collection scheduler used by webserver.py.
+
+Rather than subscribing a separate CherryPy Monitor thread for every module, all of the modules are placed
+in a single priority queue ordered by the time their next collection is due.  A small fixed pool of worker
+threads pops due modules off the queue and runs them, so the number of threads stays the same no matter how
+many modules are enabled.
+
+* Each module is rescheduled every SAMPLE_INTERVAL seconds.  The first run of each module is offset by a random
+  jitter so the modules don't all fire on the same second.
+* A module is never run twice at the same time.  If it is still busy when it comes due again, that run is skipped.
+* Each run has a deadline (SAMPLE_INTERVAL * deadline_factor).  Python threads can't be killed, so if a run blows
+  its deadline (for example a hung vCenter login) the worker running it is retired and a replacement worker is
+  started.  The hung module only ever holds one thread and the other modules keep their schedule.
+
+Modules can optionally define generate_json as a coroutine (async def generate_json(monitor)).  When an
+AsyncCollectionLoop is attached to the scheduler, those modules are run as tasks on a single asyncio event loop
+instead of tying up a worker thread, and a run that blows its deadline is cancelled.  Modules that stay
+synchronous keep running on the worker threads.
+
+"""
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+from cherrypy.process import plugins
+
+__author__ = 'scott@flakshack.com (Scott Vintinner)'
+
+
+class CollectionWorker(threading.Thread):
+    """A worker thread that runs module collections from the scheduler's work queue."""
+
+    def __init__(self, scheduler, number):
+        threading.Thread.__init__(self, name="CollectionWorker-" + str(number))
+        self.daemon = True
+        self.scheduler = scheduler
+        self.sb_module = None           # The module currently being collected (if any)
+        self.deadline = None            # time.monotonic() value when the current run is overdue
+        self.retired = False            # Set by the scheduler when the current run blew its deadline
+
+    def run(self):
+        logger = logging.getLogger("CollectionScheduler")
+        while not self.retired:
+            sb_module = self.scheduler.work_queue.get()
+            if sb_module is None:                   # None is the signal to shut down
+                break
+            self.deadline = time.monotonic() + (sb_module.frequency * self.scheduler.deadline_factor)
+            self.sb_module = sb_module
+            started = time.monotonic()
+            try:
+                sb_module.callback_function()
+            except Exception as error:
+                # No matter what exception we hit here, we don't want this to stop other modules from running.
+                logger.error("Error running " + sb_module.module_name + ": " + str(error))
+            finally:
+                self.sb_module = None
+                self.deadline = None
+                sb_module.busy = False
+            logger.debug(sb_module.module_name + " finished in " + str(round(time.monotonic() - started, 2)) + "s")
+
+
+class AsyncCollectionLoop(plugins.SimplePlugin):
+    """CherryPy plugin that runs one asyncio event loop in a background thread for modules with an async
+    generate_json.  Blocking calls inside those coroutines should use loop.run_in_executor(None, ...), which
+    runs them on a small thread pool owned by this loop."""
+
+    def __init__(self, bus, executor_threads=4):
+        plugins.SimplePlugin.__init__(self, bus)
+        self.executor_threads = executor_threads
+        self.loop = None
+        self._thread = None
+
+    def start(self):
+        """Called by the CherryPy engine when it starts."""
+        self.bus.log("Starting asyncio collection loop")
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=self.executor_threads))
+        self._thread = threading.Thread(target=self._run, name="AsyncCollectionLoop")
+        self._thread.daemon = True
+        self._thread.start()
+    start.priority = 40     # Start before the scheduler so the loop is ready for the first runs
+
+    def stop(self):
+        """Called by the CherryPy engine when it stops."""
+        self.bus.log("Stopping asyncio collection loop")
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = None
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, sb_module, timeout):
+        """Schedule a run of the module's coroutine on the event loop (safe to call from any thread)."""
+        return asyncio.run_coroutine_threadsafe(self._collect(sb_module, timeout), self.loop)
+
+    @staticmethod
+    async def _collect(sb_module, timeout):
+        logger = logging.getLogger("CollectionScheduler")
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(sb_module.callback_coroutine(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(sb_module.module_name + " has been running longer than " + str(timeout) +
+                           " seconds.  Cancelled.")
+        except Exception as error:
+            # No matter what exception we hit here, we don't want this to stop other modules from running.
+            logger.error("Error running " + sb_module.module_name + ": " + str(error))
+        finally:
+            sb_module.busy = False
+        logger.debug(sb_module.module_name + " finished in " + str(round(time.monotonic() - started, 2)) + "s")
+
+
+class CollectionScheduler(plugins.SimplePlugin):
+    """CherryPy plugin that runs every module's callback_function from a bounded pool of worker threads."""
+
+    def __init__(self, bus, workers=4, jitter=5, deadline_factor=2, async_loop=None):
+        plugins.SimplePlugin.__init__(self, bus)
+        self.async_loop = async_loop            # Optional AsyncCollectionLoop for modules with async generate_json
+        self.workers = workers                  # Number of collection threads
+        self.jitter = jitter                    # Max random delay (seconds) added to each module's first run
+        self.deadline_factor = deadline_factor  # A run is overdue after SAMPLE_INTERVAL * deadline_factor
+        self.work_queue = queue.Queue()         # Modules that are due and waiting for a free worker
+        self.all_workers = []
+        self._schedule = []                     # Priority queue of (next_due, sequence, module)
+        self._sequence = itertools.count()      # Tie-breaker so heapq never has to compare modules
+        self._condition = threading.Condition()
+        self._dispatcher = None
+        self._running = False
+        self._worker_count = itertools.count(1)
+
+    def add(self, sb_module, delay=0):
+        """Add a module to the schedule.  Its first run will happen after 'delay' seconds plus a random jitter."""
+        sb_module.busy = False
+        if not hasattr(sb_module, "is_async"):
+            sb_module.is_async = False
+        self._push(sb_module, time.monotonic() + delay + random.uniform(0, self.jitter))
+
+    def _push(self, sb_module, next_due):
+        with self._condition:
+            heapq.heappush(self._schedule, (next_due, next(self._sequence), sb_module))
+            self._condition.notify()
+
+    def _start_worker(self):
+        worker = CollectionWorker(self, next(self._worker_count))
+        self.all_workers.append(worker)
+        worker.start()
+
+    def start(self):
+        """Called by the CherryPy engine when it starts."""
+        self.bus.log("Starting collection scheduler with " + str(self.workers) + " workers")
+        self._running = True
+        for i in range(self.workers):
+            self._start_worker()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="CollectionScheduler")
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    def stop(self):
+        """Called by the CherryPy engine when it stops."""
+        self.bus.log("Stopping collection scheduler")
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        for worker in self.all_workers:
+            self.work_queue.put(None)
+        self.all_workers = []
+
+    def _check_deadlines(self):
+        """Retire any worker whose current run is past its deadline and replace it with a fresh one."""
+        logger = logging.getLogger("CollectionScheduler")
+        now = time.monotonic()
+        for worker in list(self.all_workers):
+            sb_module = worker.sb_module
+            deadline = worker.deadline
+            if deadline is not None and sb_module is not None and now > deadline:
+                logger.warning(sb_module.module_name + " has been running longer than " +
+                               str(sb_module.frequency * self.deadline_factor) +
+                               " seconds.  Retiring its worker and starting a replacement.")
+                worker.retired = True
+                self.all_workers.remove(worker)
+                self._start_worker()
+
+    def _dispatch(self):
+        """Wait for the next module to come due and hand it off to the worker pool."""
+        logger = logging.getLogger("CollectionScheduler")
+        while True:
+            with self._condition:
+                while self._running:
+                    now = time.monotonic()
+                    if self._schedule and self._schedule[0][0] <= now:
+                        break
+                    # Wake up at least once a second to check deadlines
+                    timeout = 1.0
+                    if self._schedule:
+                        timeout = min(timeout, self._schedule[0][0] - now)
+                    self._condition.wait(timeout)
+                    self._check_deadlines()
+                if not self._running:
+                    return
+                next_due, sequence, sb_module = heapq.heappop(self._schedule)
+
+            # Reschedule relative to when it was due (not when it ran) so the modules don't drift.
+            # If we've fallen more than a full interval behind, start counting again from now.
+            now = time.monotonic()
+            next_due += sb_module.frequency
+            if next_due < now:
+                next_due = now + sb_module.frequency
+            self._push(sb_module, next_due)
+
+            if sb_module.busy:
+                logger.warning(sb_module.module_name + " is still running from the last interval, skipping.")
+                continue
+            sb_module.busy = True
+            if sb_module.is_async and self.async_loop is not None and self.async_loop.loop is not None:
+                self.async_loop.submit(sb_module, sb_module.frequency * self.deadline_factor)
+            else:
+                self.work_queue.put(sb_module)
@@ -0,0 +1,327 @@
+"""snmp_engine - Shared SNMP polling used by the snmp_interface and snmp_environmental modules.
+
+Each device (ip + community + SNMP version) gets a single long-lived SNMPDevice with its own CommandGenerator and
+UdpTransportTarget, so we don't build a new SNMP engine for every request.
+
+Modules register the OIDs they want from a device.  The first module to poll a device in each tick GETs every OID
+registered for that device (packed into as few multi-OID GETs as possible) and caches the results.  Any other
+module that asks the same device within COALESCE_SECONDS gets the cached values, so one poll of each device serves
+every panel that uses it.  Different devices are polled in parallel.
+
+The bandwidth graphs are described declaratively as a list of BandwidthSeries (a name, a device and the octet
+counters to add together), and the sampling, bps calculation and datapoint history (a TimeSeries) are handled here.  A series can
+name its interfaces by ifName or ifAlias instead of hardcoding ifIndex OIDs.  The device's ifXTable is walked once
+with GETBULK, the name-to-ifIndex map is cached for DISCOVERY_TTL seconds, and only the matching counters are polled.
+If a counter disappears (the device renumbered its interfaces), the table is walked again right away.
+
+# How To Calculate Bandwidth Utilization Using SNMP
+# http://www.cisco.com/en/US/tech/tk648/tk362/technologies_tech_note09186a008009496e.shtml
+"""
+from pysnmp.entity.rfc3413.oneliner import cmdgen
+import concurrent.futures
+import logging
+import threading
+import time
+from timeseries import TimeSeries
+
+__author__ = 'scott@flakshack.com (Scott Vintinner)'
+
+# =================================SETTINGS======================================
+UPTIME_OID = "1.3.6.1.2.1.1.3.0"    # sysUpTime (hundreds of a second), so we know when each sample was taken
+MAX_OIDS_PER_REQUEST = 40           # Max OIDs in one SNMP GET (keeps the response inside a single UDP packet)
+COALESCE_SECONDS = 15               # Polls of the same device within this many seconds share the same GETs
+MAX_PARALLEL_DEVICES = 8            # How many devices we poll at the same time
+MAX_REPETITIONS = 25                # Rows per GETBULK request when walking a table
+DISCOVERY_TTL = 3600                # How long (seconds) we cache each device's ifName/ifAlias to ifIndex map
+
+# ifXTable columns
+IF_NAME_OID = "1.3.6.1.2.1.31.1.1.1.1"
+IF_ALIAS_OID = "1.3.6.1.2.1.31.1.1.1.18"
+IF_HC_IN_OCTETS_OID = "1.3.6.1.2.1.31.1.1.1.6"      # 64-bit counters because 32-bit defaults rollover too quickly
+IF_HC_OUT_OCTETS_OID = "1.3.6.1.2.1.31.1.1.1.10"
+# ===============================================================================
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_PARALLEL_DEVICES)
+
+
+class SNMPError(Exception):
+    pass
+
+
+class SNMPDevice:
+    """A single SNMP agent.  Use SNMPDevice.get() so every module shares the same object for a device."""
+    all_devices = {}                    # (ip, community, mp_model) -> SNMPDevice
+    _all_devices_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, ip, community, mp_model=1):
+        """Returns the shared SNMPDevice for this ip/community.  Use mp_model=0 for SNMPv1 devices."""
+        key = (ip, community, mp_model)
+        with cls._all_devices_lock:
+            if key not in cls.all_devices:
+                cls.all_devices[key] = cls(ip, community, mp_model)
+            return cls.all_devices[key]
+
+    def __init__(self, ip, community, mp_model=1):
+        self.ip = ip
+        self.cmd_gen = cmdgen.CommandGenerator()
+        self.community_data = cmdgen.CommunityData(community, mpModel=mp_model)
+        self.transport = cmdgen.UdpTransportTarget((ip, 161))
+        self.registered_oids = []       # Every OID that any module wants from this device
+        self.all_series = []            # BandwidthSeries polling this device (see unregister)
+        self.values = {}                # oid -> value from the last poll
+        self.uptime = None              # sysUpTime from the last poll
+        self.error = None               # Error message from the last poll (if any)
+        self.last_poll = None           # time.monotonic() of the last poll
+        self.if_indexes = None          # ifName/ifAlias -> ifIndex (see discover_interfaces)
+        self.last_discovery = None      # time.monotonic() of the last ifXTable walk
+        self.lock = threading.Lock()    # Only one poll of the device at a time
+
+    def register(self, oids):
+        """Add OIDs to the list we GET from this device on every poll."""
+        with self.lock:
+            for oid in oids:
+                if oid not in self.registered_oids:
+                    self.registered_oids.append(oid)
+
+    def unregister(self, oids):
+        """Stop polling OIDs that a BandwidthSeries no longer uses (its interface moved to a new ifIndex).
+        OIDs that another series on this device still uses are kept."""
+        with self.lock:
+            in_use = set()
+            for series in self.all_series:
+                in_use.update(series.oids)
+            for oid in oids:
+                if oid not in in_use and oid in self.registered_oids:
+                    self.registered_oids.remove(oid)
+                    self.values.pop(oid, None)
+
+    def poll(self, oids):
+        """Returns a list with the value of each OID (in the same order), the uptime and an error message (or None).
+        If the device was already polled within COALESCE_SECONDS, the cached values are returned instead."""
+        self.register(oids)
+        with self.lock:
+            now = time.monotonic()
+            missing = [oid for oid in oids if oid not in self.values]
+            if self.last_poll is None or now - self.last_poll > COALESCE_SECONDS or (missing and not self.error):
+                self._get_all()
+                self.last_poll = now
+            if self.error:
+                return None, None, self.error
+            return [self.values.get(oid) for oid in oids], self.uptime, None
+
+    def _get_all(self):
+        """GET every registered OID, MAX_OIDS_PER_REQUEST at a time.  Must be called with self.lock held."""
+        logger = logging.getLogger("snmp_engine")
+        values = {}
+        uptime = None
+        oids_per_request = MAX_OIDS_PER_REQUEST - 1        # Leave room for the uptime OID
+        try:
+            for i in range(0, len(self.registered_oids), oids_per_request):
+                request_oids = self.registered_oids[i:i + oids_per_request]
+                logger.debug("Getting " + str(len(request_oids)) + " OIDs from " + self.ip)
+                error_indication, error_status, error_index, var_binds = self.cmd_gen.getCmd(
+                    self.community_data, self.transport, UPTIME_OID, *request_oids
+                )
+                if error_indication:                        # Check for SNMP errors
+                    raise SNMPError(str(error_indication))
+                if error_status:
+                    raise SNMPError(error_status.prettyPrint())
+
+                # varBinds are returned as SNMP objects, so convert to integers
+                if uptime is None:
+                    uptime = int(var_binds[0][1])
+                for oid, var_bind in zip(request_oids, var_binds[1:]):
+                    try:
+                        values[oid] = int(var_bind[1])
+                    except Exception:
+                        values[oid] = None                  # noSuchObject/noSuchInstance
+        except Exception as error:
+            logger.warning("Error retrieving SNMP data from " + self.ip + ": " + str(error))
+            self.values = {}
+            self.uptime = None
+            self.error = str(error)
+        else:
+            self.values = values
+            self.uptime = uptime
+            self.error = None
+
+    def bulk(self, *oids):
+        """Walks the table(s) under the OIDs with GETBULK, MAX_REPETITIONS rows per request.
+        Returns the var_bind table (one row per table entry) and an error message (or None)."""
+        with self.lock:
+            return self._bulk(*oids)
+
+    def _bulk(self, *oids):
+        error_indication, error_status, error_index, var_bind_table = self.cmd_gen.bulkCmd(
+            self.community_data, self.transport, 0, MAX_REPETITIONS, *oids
+        )
+        if error_indication:
+            return None, str(error_indication)
+        if error_status:
+            return None, error_status.prettyPrint()
+        return var_bind_table, None
+
+    def discover_interfaces(self, force=False):
+        """Returns a dictionary of {ifName or ifAlias: ifIndex} for the device.  The ifXTable is only walked when
+        the cached map is older than DISCOVERY_TTL (or, with force, older than COALESCE_SECONDS)."""
+        logger = logging.getLogger("snmp_engine")
+        with self.lock:
+            now = time.monotonic()
+            max_age = COALESCE_SECONDS if force else DISCOVERY_TTL
+            if self.if_indexes is not None and now - self.last_discovery < max_age:
+                return self.if_indexes
+
+            logger.debug("Walking ifXTable on " + self.ip)
+            var_bind_table, snmp_error = self._bulk(IF_NAME_OID, IF_ALIAS_OID)
+            if snmp_error:
+                if self.if_indexes is None:
+                    raise SNMPError(snmp_error)
+                # Keep using the old map until the device answers again
+                logger.warning("Error walking ifXTable on " + self.ip + ": " + snmp_error)
+                return self.if_indexes
+
+            by_name = {}
+            by_alias = {}
+            for (name_oid, if_name), (alias_oid, if_alias) in var_bind_table:
+                if_index = int(name_oid[-1])
+                by_name[str(if_name)] = if_index
+                if str(if_alias):
+                    by_alias[str(if_alias)] = if_index
+            by_alias.update(by_name)            # If an ifName and ifAlias match, the ifName wins
+            self.if_indexes = by_alias
+            self.last_discovery = now
+            return self.if_indexes
+
+
+class BandwidthSeries:
+    """One line on a bandwidth graph: the total of one or more octet counters on a device, in Mbps.
+    The counters are either listed as OIDs, or as interfaces (ifName or ifAlias) to total the in and out octets of."""
+
+    def __init__(self, name, ip, community, oids=(), max_datapoints=30, interfaces=()):
+        self.name = name
+        self.device = SNMPDevice.get(ip, community)
+        self.oids = list(oids)
+        self.interfaces = list(interfaces)
+        self.max_datapoints = max_datapoints
+        self.snmp_data = TimeSeries(max_datapoints, "Q")    # Hold raw data (octets, timestamped with the uptime)
+        self.datapoints = TimeSeries(max_datapoints)        # Holds pretty data (Mbps)
+        self.device.all_series.append(self)
+        if self.oids:
+            self.device.register(self.oids)
+
+    def resolve(self, force=False):
+        """Look up the counter OIDs for our interfaces in the device's (cached) ifXTable."""
+        if not self.interfaces:
+            return
+        if_indexes = self.device.discover_interfaces(force)
+        oids = []
+        for interface in self.interfaces:
+            if interface not in if_indexes:
+                raise SNMPError(self.device.ip + ": Interface not found " + interface)
+            oids.append(IF_HC_IN_OCTETS_OID + "." + str(if_indexes[interface]))
+            oids.append(IF_HC_OUT_OCTETS_OID + "." + str(if_indexes[interface]))
+        if oids != self.oids:
+            if self.oids:
+                logging.getLogger("snmp_engine").info(self.device.ip + ": " + self.name + " moved to " + str(oids))
+            old_oids = self.oids
+            self.oids = oids
+            self.snmp_data.clear()          # The old samples were from different counters
+            self.device.register(self.oids)
+            self.device.unregister(old_oids)    # Don't keep polling the counters of the old ifIndex
+
+    def add_sample(self, snmp_values, snmp_uptime_value, timestamp):
+        """Add the latest counter values and, once we have 2 samples, the bps since the last one."""
+        self.snmp_data.append(sum(snmp_values), snmp_uptime_value)
+
+        # If we have at least 2 samples, calculate bps by comparing the last item with the second to last item
+        if len(self.snmp_data) > 1:
+            bps = calculate_bps(
+                self.snmp_data[-1],
+                self.snmp_data.time(-1),
+                self.snmp_data[-2],
+                self.snmp_data.time(-2)
+            )
+            self.datapoints.append(bps, timestamp)
+
+    def datasequence(self):
+        return {"title": self.name, "datapoints": self.datapoints.datapoints()}
+
+
+def calculate_bps(current_sample_octets, current_sample_time, historical_sample_octets, historical_sample_time):
+    """Calculate the bits-per-second based on the octets and timeticks (hundreths of a second)."""
+
+    # When the SNMP counter reaches 18446744073709551615, it will rollover and reset to ZERO.
+    # If this happens, we want to make sure we don't output a negative bps
+    if current_sample_octets < historical_sample_octets:
+        # If we reset to 0, add the max value of the octets counter
+        current_sample_octets += 18446744073709551615
+
+    delta = current_sample_octets - historical_sample_octets
+
+    # SysUpTime is in TimeTicks (Hundreds of a second), so covert to seconds
+    seconds_between_samples = (current_sample_time - historical_sample_time) / 100.0
+
+    # Multiply octets by 8 to get bits
+    bps = (delta * 8) / seconds_between_samples
+    bps /= 1048576          # Convert to Mbps
+    bps = round(bps, 2)
+    return bps
+
+
+def poll_devices(device_oids):
+    """Poll several devices in parallel.  device_oids is a dictionary of {SNMPDevice: [oids]}.
+    Returns a dictionary of {SNMPDevice: (values, uptime, error)} (see SNMPDevice.poll)."""
+    futures = {}
+    for device, oids in device_oids.items():
+        futures[device] = _executor.submit(device.poll, oids)
+
+    results = {}
+    for device, future in futures.items():
+        try:
+            results[device] = future.result()
+        except Exception as error:
+            results[device] = (None, None, str(error))
+    return results
+
+
+def poll_series(all_series):
+    """Poll every device used by a list of BandwidthSeries and add the new sample to each series.
+    Returns an error message if any device couldn't be polled (in which case no series are updated)."""
+    timestamp = time.time()         # Use the same time value for all samples per iteration
+    for attempt in range(2):
+        try:
+            for series in all_series:
+                series.resolve(force=(attempt > 0))
+        except Exception as error:
+            return str(error)
+
+        device_oids = {}
+        for series in all_series:
+            device_oids.setdefault(series.device, []).extend(series.oids)
+        results = poll_devices(device_oids)
+
+        snmp_error = None
+        missing_oid = False
+        for device, (snmp_values, snmp_uptime_value, device_error) in results.items():
+            if device_error:
+                snmp_error = device.ip + ": " + device_error
+            elif None in snmp_values:
+                snmp_error = device.ip + ": No such OID " + device_oids[device][snmp_values.index(None)]
+                missing_oid = True
+
+        # A missing counter usually means the interfaces were renumbered, so walk the ifXTable again and retry
+        if missing_oid and attempt == 0 and any(series.interfaces for series in all_series):
+            continue
+        if snmp_error:
+            return snmp_error
+        break
+
+    # Each series gets its own slice of its device's values
+    offsets = {}
+    for series in all_series:
+        snmp_values, snmp_uptime_value, snmp_error = results[series.device]
+        start = offsets.get(series.device, 0)
+        offsets[series.device] = start + len(series.oids)
+        series.add_sample(snmp_values[start:start + len(series.oids)], snmp_uptime_value, timestamp)
+    return None
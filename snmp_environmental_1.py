@@ -7,17 +7,39 @@ Output data will look like this:
 {"temperature": "75", "humidity": "50", "ups_load": "4.7", "runtime": "1:17"}
 
 """
-from pysnmp.entity.rfc3413.oneliner import cmdgen
 import time
 import json
 import logging.config
 from credentials import SNMP_COMMUNITY
+import snmp_engine
 
 __author__ = 'scott@flakshack.com (Scott Vintinner)'
 
 
 # =================================SETTINGS======================================
 SAMPLE_INTERVAL = 60
+
+# The OIDs we need from each device.  All of the OIDs for a device are requested in one GET.
+CLT_NETBOTZ1_OIDS = (
+    "1.3.6.1.4.1.5528.100.4.1.1.1.9.636159851",     # Room Temp (Rack 4 Top)
+    "1.3.6.1.4.1.5528.100.4.1.1.1.9.3031356659",    # Hot Aisle (HAC 2 Temp)
+    "1.3.6.1.4.1.5528.100.4.1.2.1.8.1744856019"     # Humidity
+)
+CLT_NETBOTZ2_OIDS = (
+    "1.3.6.1.4.1.5528.100.4.1.1.1.9.2628357572",    # Cold Aisle (Rack 3 bottom Temp)
+)
+CLT_SYMMETRA_OIDS = (
+    "1.3.6.1.4.1.318.1.1.1.2.2.3.0",                # UPS Runtime
+    "1.3.6.1.4.1.318.1.1.1.9.3.3.1.7.1.1.1",        # UPS Load Phase 1
+    "1.3.6.1.4.1.318.1.1.1.9.3.3.1.7.1.1.2",        # UPS Load Phase 2
+    "1.3.6.1.4.1.318.1.1.1.9.3.3.1.7.1.1.3"         # UPS Load Phase 3
+)
+APC_SMARTUPS_OIDS = (
+    "1.3.6.1.2.1.33.1.2.3.0",                       # UPS Runtime
+    "1.3.6.1.2.1.33.1.4.4.1.5.1",                   # UPS Output Load Percent
+    "1.3.6.1.4.1.318.1.1.10.2.3.2.1.6.1",           # Humidity
+    "1.3.6.1.4.1.318.1.1.10.2.3.2.1.4.1"            # Temperature
+)
 # ===============================================================================
 
 
@@ -41,136 +63,106 @@ def generate_json(snmp_monitor):
 
     logger = logging.getLogger("snmp_environmental_1")
 
-    # Create the pysnmp SNMP CommandGenerator, used to get SNMP data
-    cmd_gen = cmdgen.CommandGenerator()
+    # The shared snmp_engine devices (the APC SMARTUPS devices must be SNMPv1, so mp_model=0)
+    clt_netbotz1 = snmp_engine.SNMPDevice.get("10.5.50.235", SNMP_COMMUNITY)
+    clt_netbotz2 = snmp_engine.SNMPDevice.get("10.5.50.236", SNMP_COMMUNITY)
+    clt_symmetra = snmp_engine.SNMPDevice.get("10.5.50.230", SNMP_COMMUNITY)
+    rh_apc = snmp_engine.SNMPDevice.get("apc-rh-0.rbh.local", SNMP_COMMUNITY, mp_model=0)
+    tri_apc = snmp_engine.SNMPDevice.get("apc-tri-0.rbh.local", SNMP_COMMUNITY, mp_model=0)
+    ral_apc = snmp_engine.SNMPDevice.get("apc-ral-0.rbh.local", SNMP_COMMUNITY, mp_model=0)
 
     try:
-        # ===============CLT NetBotz1 data
-        logger.debug("Getting: CLT NetBotz1 data")
-        error_indication, error_status, error_index, var_binds = cmd_gen.getCmd(
-            cmdgen.CommunityData(SNMP_COMMUNITY),
-            cmdgen.UdpTransportTarget(('10.5.50.235', 161)),
-            "1.3.6.1.4.1.5528.100.4.1.1.1.9.636159851",     # Room Temp (Rack 4 Top)
-            "1.3.6.1.4.1.5528.100.4.1.1.1.9.3031356659",    # Hot Aisle (HAC 2 Temp)
-            "1.3.6.1.4.1.5528.100.4.1.2.1.8.1744856019"     # Humidity
-        )
+        # Poll all of the devices at the same time
+        logger.debug("Getting: SNMP data")
+        results = snmp_engine.poll_devices({
+            clt_netbotz1: CLT_NETBOTZ1_OIDS,
+            clt_netbotz2: CLT_NETBOTZ2_OIDS,
+            clt_symmetra: CLT_SYMMETRA_OIDS,
+            rh_apc: APC_SMARTUPS_OIDS,
+            tri_apc: APC_SMARTUPS_OIDS,
+            ral_apc: APC_SMARTUPS_OIDS
+        })
 
-        if error_indication or error_status:
-            logger.warning("CLT NetBotz1: " + str(error_indication))
+        # ===============CLT NetBotz1 data
+        snmp_values, snmp_uptime, snmp_error = results[clt_netbotz1]
+        if snmp_error:
+            logger.warning("CLT NetBotz1: " + snmp_error)
             clt_temperature = "XX"
             hot_aisle = "XX"
             clt_humidity = "XX"
         else:
-            clt_temperature = int(var_binds[0][1])
-            hot_aisle = int(var_binds[1][1])
-            clt_humidity = int(var_binds[2][1])
+            clt_temperature = int(snmp_values[0])
+            hot_aisle = int(snmp_values[1])
+            clt_humidity = int(snmp_values[2])
 
         # ===============CLT NetBotz2 data
-        logger.debug("Getting: CLT NetBotz2 data")
-        error_indication, error_status, error_index, var_binds = cmd_gen.getCmd(
-            cmdgen.CommunityData(SNMP_COMMUNITY),
-            cmdgen.UdpTransportTarget(('10.5.50.236', 161)),
-            "1.3.6.1.4.1.5528.100.4.1.1.1.9.2628357572",     # Cold Aisle (Rack 3 bottom Temp)
-        )
-
-        if error_indication or error_status:
-            logger.warning("CLT NetBotz2: " + str(error_indication))
+        snmp_values, snmp_uptime, snmp_error = results[clt_netbotz2]
+        if snmp_error:
+            logger.warning("CLT NetBotz2: " + snmp_error)
             cold_aisle = "XX"
         else:
-            cold_aisle = int(var_binds[0][1])
+            cold_aisle = int(snmp_values[0])
 
         # ============ CLT Symmetra data
-        logger.debug("Getting: CLT Symmetra data")
-        error_indication, error_status, error_index, var_binds = cmd_gen.getCmd(
-            cmdgen.CommunityData(SNMP_COMMUNITY),
-            cmdgen.UdpTransportTarget(("10.5.50.230", 161)),
-            "1.3.6.1.4.1.318.1.1.1.2.2.3.0",                # UPS Runtime
-            "1.3.6.1.4.1.318.1.1.1.9.3.3.1.7.1.1.1",        # UPS Load Phase 1
-            "1.3.6.1.4.1.318.1.1.1.9.3.3.1.7.1.1.2",        # UPS Load Phase 2
-            "1.3.6.1.4.1.318.1.1.1.9.3.3.1.7.1.1.3"         # UPS Load Phase 3
-        )
-        if error_indication or error_status:
-            logger.warning("CLT Symmetra: " + str(error_indication))
+        snmp_values, snmp_uptime, snmp_error = results[clt_symmetra]
+        if snmp_error:
+            logger.warning("CLT Symmetra: " + snmp_error)
             clt_runtime = "XX"
             clt_load = "XX"
         else:
-            clt_runtime = int(var_binds[0][1]) / 100 / 60        # Convert TimeTicks to Seconds to minutes
+            clt_runtime = int(snmp_values[0]) / 100 / 60        # Convert TimeTicks to Seconds to minutes
             clt_runtime = int(clt_runtime)
 
-            load_p1 = int(var_binds[1][1])
-            load_p2 = int(var_binds[2][1])
-            load_p3 = int(var_binds[3][1])
+            load_p1 = int(snmp_values[1])
+            load_p2 = int(snmp_values[2])
+            load_p3 = int(snmp_values[3])
 
             clt_load = (load_p1 + load_p2 + load_p3) / 1000      # Convert to kVA
             clt_load = round(clt_load, 1)
 
-        # ===============RH APC SMARTUPS  (Must be SNMPv1)
-        logger.debug("Getting: RH APC SMARTUPS data")
-        error_indication, error_status, error_index, var_binds = cmd_gen.getCmd(
-            cmdgen.CommunityData(SNMP_COMMUNITY, mpModel=0),       # mpModel=0 for SNMPv1
-            cmdgen.UdpTransportTarget(("apc-rh-0.rbh.local", 161)),
-            "1.3.6.1.2.1.33.1.2.3.0",                             # UPS Runtime
-            "1.3.6.1.2.1.33.1.4.4.1.5.1",                         # UPS Output Load Percent
-            "1.3.6.1.4.1.318.1.1.10.2.3.2.1.6.1",                 # Humidity
-            "1.3.6.1.4.1.318.1.1.10.2.3.2.1.4.1"                  # Temperature
-        )
-        if error_indication or error_status:
-            logger.warning("TRI APC: " + str(error_indication))
+        # ===============RH APC SMARTUPS
+        snmp_values, snmp_uptime, snmp_error = results[rh_apc]
+        if snmp_error:
+            logger.warning("RH APC: " + snmp_error)
             rh_temperature = "XX"
             rh_humidity = "XX"
             rh_load = "XX"
             rh_runtime = "XX"
         else:
-            rh_runtime = int(var_binds[0][1])
-            rh_load = int(var_binds[1][1])
-            rh_humidity = int(var_binds[2][1])
-            rh_temperature = int(var_binds[3][1])
+            rh_runtime = int(snmp_values[0])
+            rh_load = int(snmp_values[1])
+            rh_humidity = int(snmp_values[2])
+            rh_temperature = int(snmp_values[3])
             rh_temperature = int(1.8 * rh_temperature) + 32
 
-        # ===============TRI APC SMARTUPS  (Must be SNMPv1)
-        logger.debug("Getting: TRI APC SMARTUPS data")
-        error_indication, error_status, error_index, var_binds = cmd_gen.getCmd(
-            cmdgen.CommunityData(SNMP_COMMUNITY, mpModel=0),       # mpModel=0 for SNMPv1
-            cmdgen.UdpTransportTarget(("apc-tri-0.rbh.local", 161)),
-            "1.3.6.1.2.1.33.1.2.3.0",                             # UPS Runtime
-            "1.3.6.1.2.1.33.1.4.4.1.5.1",                         # UPS Output Load Percent
-            "1.3.6.1.4.1.318.1.1.10.2.3.2.1.6.1",                 # Humidity
-            "1.3.6.1.4.1.318.1.1.10.2.3.2.1.4.1"                  # Temperature
-        )
-        if error_indication or error_status:
-            logger.warning("TRI APC: " + str(error_indication))
+        # ===============TRI APC SMARTUPS
+        snmp_values, snmp_uptime, snmp_error = results[tri_apc]
+        if snmp_error:
+            logger.warning("TRI APC: " + snmp_error)
             tri_temperature = "XX"
             tri_humidity = "XX"
             tri_load = "XX"
             tri_runtime = "XX"
         else:
-            tri_runtime = int(var_binds[0][1])
-            tri_load = int(var_binds[1][1])
-            tri_humidity = int(var_binds[2][1])
-            tri_temperature = int(var_binds[3][1])
+            tri_runtime = int(snmp_values[0])
+            tri_load = int(snmp_values[1])
+            tri_humidity = int(snmp_values[2])
+            tri_temperature = int(snmp_values[3])
             tri_temperature = int(1.8 * tri_temperature) + 32
 
-        # ===============RAL APC SMARTUPS  (Must be SNMPv1)
-        logger.debug("Getting: RAL APC SMARTUPS data")
-        error_indication, error_status, error_index, var_binds = cmd_gen.getCmd(
-            cmdgen.CommunityData(SNMP_COMMUNITY, mpModel=0),       # mpModel=0 for SNMPv1
-            cmdgen.UdpTransportTarget(("apc-ral-0.rbh.local", 161)),
-            "1.3.6.1.2.1.33.1.2.3.0",                             # UPS Runtime
-            "1.3.6.1.2.1.33.1.4.4.1.5.1",                         # UPS Output Load Percent
-            "1.3.6.1.4.1.318.1.1.10.2.3.2.1.6.1",                 # Humidity
-            "1.3.6.1.4.1.318.1.1.10.2.3.2.1.4.1"                  # Temperature
-        )
-        if error_indication or error_status:
-            logger.warning("RAL APC: " + str(error_indication))
+        # ===============RAL APC SMARTUPS
+        snmp_values, snmp_uptime, snmp_error = results[ral_apc]
+        if snmp_error:
+            logger.warning("RAL APC: " + snmp_error)
             ral_temperature = "XX"
             ral_humidity = "XX"
             ral_load = "XX"
             ral_runtime = "XX"
         else:
-            ral_runtime = int(var_binds[0][1])
-            ral_load = int(var_binds[1][1])
-            ral_humidity = int(var_binds[2][1])
-            ral_temperature = int(var_binds[3][1])
+            ral_runtime = int(snmp_values[0])
+            ral_load = int(snmp_values[1])
+            ral_humidity = int(snmp_values[2])
+            ral_temperature = int(snmp_values[3])
             ral_temperature = int(1.8 * ral_temperature) + 32
 
         # =========== Create Dictionary for JSON output
@@ -2,11 +2,12 @@
 """snmp_interface: module called to generate SNMP monitoring data formatted for use with StatusBoard iPad App
 
 """
-from pysnmp.entity.rfc3413.oneliner import cmdgen
 import time
 import json
 import logging.config
 from credentials import SNMP_COMMUNITY
+import snmp_engine
+from timeseries import TimeSeries
 
 __author__ = 'scott@flakshack.com (Scott Vintinner)'
 
@@ -48,7 +49,7 @@ class InterfaceDevice:
         self.community = community
         self.oid = oid
         self.name = name
-        self.datapoints = []
+        self.datapoints = TimeSeries(MAX_DATAPOINTS, "q")   # Number of active calls
         self.__class__.all_devices.append(self)     # Add self to static array
 
 
@@ -56,26 +57,17 @@ def get_snmp(device, community, snmp_oid):
     """This code will grab the contents of an SNMP table and count the instances of the value 4
     which represents active calls."""
 
-    # Perform a synchronous SNMP GET
-    cmd_gen = cmdgen.CommandGenerator()
-    error_indication, error_status, error_index, var_binds = cmd_gen.bulkCmd(
-        cmdgen.CommunityData(community), cmdgen.UdpTransportTarget((device, 161)), 0, 25, snmp_oid)
+    # Walk the table with GETBULK using the shared snmp_engine device (and its long-lived transport)
+    var_binds, snmp_error = snmp_engine.SNMPDevice.get(device, community).bulk(snmp_oid)
 
     snmp_value = None
-    snmp_error = None
-
-    if error_indication:                         # Check for SNMP errors
-        snmp_error = str(error_indication)
-    else:
-        if error_status:
-            snmp_error = error_status.prettyPrint()
-        else:
-            # This OID will return a table, so we will loop through the entries in the table
-            snmp_value = 0
-            for snmp_entry in var_binds:
-                # Check if the value is 4 (active call) and increment the counter
-                if int(snmp_entry[0][1]) == 4:
-                    snmp_value += 1
+    if not snmp_error:
+        # This OID will return a table, so we will loop through the entries in the table
+        snmp_value = 0
+        for snmp_entry in var_binds:
+            # Check if the value is 4 (active call) and increment the counter
+            if int(snmp_entry[0][1]) == 4:
+                snmp_value += 1
 
     return snmp_value, snmp_error
 
@@ -118,16 +110,10 @@ def generate_json(snmp_monitor):
             break
         else:
             logger.debug("value:" + str(snmp_value))
-            if len(device.datapoints) == 0:
-                device.datapoints = [{"title": time_x_axis, "value": snmp_value}]
-            else:
-                device.datapoints.append({"title": time_x_axis, "value": snmp_value})
-            # If we already have the max number of datapoints, delete the oldest item.
-            if len(device.datapoints) >= MAX_DATAPOINTS:
-                del(device.datapoints[0])
+            device.datapoints.append(snmp_value)
 
         # Generate the data sequence
-        statusbar_datasequences.append({"title": device.name, "datapoints": device.datapoints})
+        statusbar_datasequences.append({"title": device.name, "datapoints": device.datapoints.datapoints()})
 
         # Generate JSON output and assign to snmp_monitor object (for return back to caller module)
         statusbar_graph = {
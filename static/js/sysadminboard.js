@@ -0,0 +1,242 @@
+/*
+ * sysadminboard.js - Shared AJAX client for the SysAdminBoard pages.
+ *
+ * Module pages create a SysAdminBoard.Request in place of an XMLHttpRequest.  It is used exactly the same way
+ * (open, send, onreadystatechange, readyState, status and responseText), so the rest of the page doesn't change:
+ *
+ *      var xmlHTTP = new SysAdminBoard.Request();
+ *
+ * When a module page is loaded by itself, the Request just does a normal XMLHttpRequest to /module/ajax.
+ *
+ * When a module page is loaded in an iframe of a layout page (1920x1080.html, etc) that has called
+ * SysAdminBoard.startBatch(), the Request gets its data from the layout page instead.  The layout page opens a
+ * single /ajax/events connection for all of the modules on the screen and the server pushes each module's data
+ * as soon as it is collected.  The page's onreadystatechange is called again each time new data arrives, so
+ * panels update right away instead of waiting for their next timer.  Browsers without EventSource fall back to
+ * a single request to /ajax/batch every interval.
+ */
+var SysAdminBoard = (function () {
+    var MODULE_URL = /\/([^\/?#]+)\/ajax([?#].*)?$/;    // Matches http://server/module/ajax
+    var batch = null;                                   // Batch state (only used on a layout page)
+
+
+    // =====================================================================
+    // Layout page: get every module used by our iframes from /ajax/events (or /ajax/batch)
+    // =====================================================================
+    function startBatch(interval) {
+        batch = {
+            interval: interval || 15000,
+            modules: {},            // module name -> {version, status, text, listeners}
+            timer: null,
+            busy: false,
+            events: null            // EventSource connected to /ajax/events
+        };
+        if (!window.EventSource) {
+            setInterval(pollBatch, batch.interval);
+        }
+    }
+
+    function isBatching() {
+        return batch !== null;
+    }
+
+    function getModule(module_name) {
+        if (!(module_name in batch.modules)) {
+            batch.modules[module_name] = {version: "", status: 0, text: null, listeners: []};
+            // Wait a moment so that all of the iframes loading now are picked up by the same request
+            if (batch.timer === null) {
+                batch.timer = setTimeout(window.EventSource ? connectEvents : pollBatch, 250);
+            }
+        }
+        return batch.modules[module_name];
+    }
+
+    // Called (from an iframe) by Request.send
+    function requestModule(module_name, request) {
+        var module = getModule(module_name);
+
+        // Keep the latest request from each page, so we can call it again when new data arrives
+        var listeners = [request];
+        for (var i = 0; i < module.listeners.length; i++) {
+            if (module.listeners[i].window !== request.window && !module.listeners[i].window.closed) {
+                listeners.push(module.listeners[i]);
+            }
+        }
+        module.listeners = listeners;
+
+        if (module.text !== null) {
+            setTimeout(function () { request.complete(module.status, module.text); }, 0);
+        }
+    }
+
+    function deliver(module) {
+        for (var i = 0; i < module.listeners.length; i++) {
+            module.listeners[i].complete(module.status, module.text);
+        }
+    }
+
+    // Open (or re-open, when new modules have been added) the /ajax/events connection
+    function connectEvents() {
+        batch.timer = null;
+        var module_names = [];
+        for (var module_name in batch.modules) {
+            module_names.push(module_name);
+        }
+        if (batch.events !== null) {
+            batch.events.close();
+        }
+        batch.events = new EventSource(location.protocol + '//' + location.host + '/ajax/events?modules=' +
+            module_names.join(','));
+
+        batch.events.addEventListener("update", function (event) {
+            var result = JSON.parse(event.data);
+            var module = batch.modules[result["module"]];
+            if (module && "error" in result) {
+                // The module isn't enabled on the server
+                module.status = 404;
+                module.text = "";
+                deliver(module);
+            } else if (module && module.version != result["version"]) {
+                module.version = result["version"];
+                module.status = 200;
+                module.text = JSON.stringify(result["data"]);
+                deliver(module);
+            }
+        });
+        batch.events.onerror = function () {
+            // The browser will reconnect by itself, unless the server answered with an error (like a 502 from a
+            // proxy while it restarts).  Then the connection is closed for good, so we open a new one ourselves.
+            if (batch.events.readyState === EventSource.CLOSED && batch.timer === null) {
+                batch.timer = setTimeout(connectEvents, batch.interval);
+            }
+            // Until then, let each page show its own error message.
+            for (var module_name in batch.modules) {
+                var module = batch.modules[module_name];
+                module.version = "";
+                module.status = 503;
+                module.text = "";
+                deliver(module);
+            }
+        };
+    }
+
+    function pollBatch() {
+        if (batch.timer !== null) {
+            clearTimeout(batch.timer);
+            batch.timer = null;
+        }
+        var module_names = [];
+        var versions = [];
+        for (var module_name in batch.modules) {
+            module_names.push(module_name);
+            versions.push(batch.modules[module_name].version);
+        }
+        if (module_names.length == 0 || batch.busy) {
+            return;
+        }
+
+        batch.busy = true;
+        var xmlHTTP = new XMLHttpRequest();
+        xmlHTTP.onreadystatechange = function () {
+            if (xmlHTTP.readyState != 4) {
+                return;
+            }
+            batch.busy = false;
+            var module_name, module;
+            if (xmlHTTP.status == 200) {
+                var results = JSON.parse(xmlHTTP.responseText)["modules"];
+                for (module_name in results) {
+                    module = batch.modules[module_name];
+                    if ("data" in results[module_name]) {
+                        module.version = results[module_name]["version"];
+                        module.status = 200;
+                        module.text = JSON.stringify(results[module_name]["data"]);
+                        deliver(module);
+                    } else if ("error" in results[module_name]) {
+                        module.status = 404;
+                        module.text = "";
+                        deliver(module);
+                    }
+                }
+            } else {
+                // Let every waiting page show its own error message
+                for (module_name in batch.modules) {
+                    module = batch.modules[module_name];
+                    module.version = "";
+                    module.status = xmlHTTP.status || 503;
+                    module.text = "";
+                    deliver(module);
+                }
+            }
+        };
+        xmlHTTP.open("GET", location.protocol + '//' + location.host + '/ajax/batch?modules=' +
+            module_names.join(',') + '&versions=' + versions.join(','), true);
+        xmlHTTP.send(null);
+    }
+
+
+    // =====================================================================
+    // Module page: drop-in replacement for XMLHttpRequest
+    // =====================================================================
+    function layoutBoard() {
+        try {
+            if (window.parent !== window && window.parent.SysAdminBoard && window.parent.SysAdminBoard.isBatching()) {
+                return window.parent.SysAdminBoard;
+            }
+        } catch (error) {
+            // The parent page is on another server, so we can't use it
+        }
+        return null;
+    }
+
+    function Request() {
+        this.window = window;           // The page that created this request
+        this.readyState = 0;
+        this.status = 0;
+        this.responseText = "";
+        this.onreadystatechange = null;
+        this.url = null;
+    }
+
+    Request.prototype.open = function (method, url) {
+        this.url = url;
+        this.readyState = 1;
+    };
+
+    Request.prototype.send = function (body) {
+        var match = MODULE_URL.exec(this.url);
+        var board = layoutBoard();
+        if (match !== null && board !== null) {
+            board.requestModule(match[1], this);
+            return;
+        }
+
+        // Not inside a batching layout page, so make a normal request
+        var request = this;
+        var xmlHTTP = new XMLHttpRequest();
+        xmlHTTP.onreadystatechange = function () {
+            if (xmlHTTP.readyState == 4) {
+                request.complete(xmlHTTP.status, xmlHTTP.responseText);
+            }
+        };
+        xmlHTTP.open("GET", this.url, true);
+        xmlHTTP.send(body);
+    };
+
+    Request.prototype.complete = function (status, text) {
+        this.readyState = 4;
+        this.status = status;
+        this.responseText = text;
+        if (this.onreadystatechange) {
+            this.onreadystatechange();
+        }
+    };
+
+
+    return {
+        startBatch: startBatch,
+        isBatching: isBatching,
+        requestModule: requestModule,
+        Request: Request
+    };
+})();
@@ -0,0 +1,104 @@
+"""timeseries - Fixed-size ring buffers for the datapoint histories kept by the data modules.
+
+Most modules keep the last MAX_DATAPOINTS samples of a counter for a line graph.  Rather than appending to a list
+and deleting the first item (which moves every other item), a TimeSeries writes each new sample over the oldest one
+in a preallocated array.  The values and sample times are stored as plain numbers in typed arrays, so thousands of
+VM histories don't turn into thousands of lists of Python objects.
+
+    cpu = TimeSeries(MAX_DATAPOINTS)
+    cpu.append(42.0)
+    cpu[-1]                     # Latest value
+    cpu.values()                # [oldest, ..., latest] for JSON output
+    cpu.total()                 # Sum of the values (kept up to date as samples are added)
+    cpu.datapoints()            # [{"title": "17:11", "value": 42.0}, ...] for the StatusBoard style graphs
+
+json.dumps(data, default=timeseries.json_default) will output any TimeSeries in data as a list of its values.
+"""
+from array import array
+import time
+
+__author__ = 'scott@flakshack.com (Scott Vintinner)'
+
+
+class TimeSeries:
+    """A ring buffer holding the last maxlen samples and the time (epoch seconds) each one was taken.
+    Use typecode "d" (the default) for floats or "q" for integers (see the array module)."""
+    __slots__ = ("maxlen", "_values", "_times", "_next", "_count", "_total")
+
+    def __init__(self, maxlen, typecode="d"):
+        self.maxlen = maxlen
+        self._values = array(typecode, [0]) * maxlen
+        self._times = array("d", [0]) * maxlen
+        self._next = 0                  # Position the next sample will be written to
+        self._count = 0                 # Number of samples held (up to maxlen)
+        self._total = 0                 # Running sum of the samples held
+
+    def append(self, value, timestamp=None):
+        """Add a sample, replacing the oldest one if the buffer is full."""
+        if self._count == self.maxlen:
+            self._total -= self._values[self._next]
+        self._values[self._next] = value
+        self._times[self._next] = time.time() if timestamp is None else timestamp
+        self._total += self._values[self._next]
+        self._next = (self._next + 1) % self.maxlen
+        if self._count < self.maxlen:
+            self._count += 1
+        if self._next == 0:
+            # Once per lap of the buffer, recalculate the sum so float rounding errors can't build up
+            self._total = sum(self._values[:self._count])
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+        self._total = 0
+
+    def total(self):
+        """Returns the sum of the values in O(1)."""
+        return self._total
+
+    def __len__(self):
+        return self._count
+
+    def _position(self, index):
+        if index < 0:
+            index += self._count
+        if index < 0 or index >= self._count:
+            raise IndexError("TimeSeries index out of range")
+        return (self._next - self._count + index) % self.maxlen
+
+    def __getitem__(self, index):
+        """Returns a value, oldest first (so [-1] is the latest sample)."""
+        return self._values[self._position(index)]
+
+    def time(self, index):
+        """Returns the time a sample was taken."""
+        return self._times[self._position(index)]
+
+    def _ordered(self, data):
+        start = (self._next - self._count) % self.maxlen
+        if start + self._count <= self.maxlen:
+            return data[start:start + self._count]
+        return data[start:] + data[:self._next]
+
+    def values(self):
+        """Returns a list of the values, oldest first."""
+        return self._ordered(self._values).tolist()
+
+    def times(self):
+        """Returns a list of the sample times, oldest first."""
+        return self._ordered(self._times).tolist()
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def datapoints(self, time_format="%H:%M"):
+        """Returns the samples as a list of {"title": time, "value": value} dictionaries, oldest first."""
+        return [{"title": time.strftime(time_format, time.localtime(timestamp)), "value": value}
+                for timestamp, value in zip(self.times(), self.values())]
+
+
+def json_default(obj):
+    """Use with json.dumps(default=json_default) to output each TimeSeries as a list of its values."""
+    if isinstance(obj, TimeSeries):
+        return obj.values()
+    raise TypeError(repr(obj) + " is not JSON serializable")
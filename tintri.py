@@ -9,6 +9,7 @@ import json
 import time
 import requests
 import logging.config
+from timeseries import TimeSeries, json_default
 from credentials import TINTRI_USER         # Login info now stored in credentials.py
 from credentials import TINTRI_PASSWORD     # Login info now stored in credentials.py
 
@@ -20,27 +21,76 @@ TINTRI_STATS_SUMMARY = "https://tintri/api/v310/flex/datastore/default/statsSumm
 TINTRI_VMSTATS = "https://tintri/v310/flex/vm/action=fetch?limit=10&sortedBy=IOPS&queryType=TOP_DOCS_BY_LATEST_TIME&sortOrder=DESC"
 SAMPLE_INTERVAL = 60
 MAX_DATAPOINTS = 30
+EXPIRED_STATUS_CODES = (401, 403)   # Responses that mean our session has expired (so we log in again)
 # ===============================================================================
 
 
 class TintriData:
     def __init__(self):
-        self.iops = []
-        self.latency = []
-        self.throughput = []
-        self.flash_hit = []
-        self.space_used = []
+        self.iops = TimeSeries(MAX_DATAPOINTS)
+        self.latency = TimeSeries(MAX_DATAPOINTS)
+        self.throughput = TimeSeries(MAX_DATAPOINTS)
+        self.flash_hit = TimeSeries(MAX_DATAPOINTS)
+        self.space_used = TimeSeries(MAX_DATAPOINTS)
 
 
 class TintriNotConnectedException(Exception):
     pass
 
 
+class TintriSession:
+    """Keeps one logged in session (the JSESSIONID cookie) to the Tintri between intervals.  We only log in
+    again when the Tintri stops accepting the session, so each interval costs a single stats request."""
+    def __init__(self):
+        self.session = None
+
+    def login(self):
+        """Create a new session and log in.  Raises TintriNotConnectedException if the login fails."""
+        logger = logging.getLogger("tintri")
+        login_payload = {
+            "typeId": "com.tintri.api.rest.vcommon.dto.rbac.RestApiCredentials",
+            "newPassword": None,
+            "roles": None,
+            "username": TINTRI_USER,
+            "password": TINTRI_PASSWORD
+        }
+        # Create Session object to persist JSESSIONID cookie (so the next requests to Tintri will work)
+        self.session = requests.Session()
+        self.session.headers.update({'content-type': 'application/json'})
+
+        # For all our requests, use the verify=False to ignore certificate errors
+        logger.debug("Connecting to:" + TINTRI_LOGIN_URL)
+        r = self.session.post(TINTRI_LOGIN_URL, data=json.dumps(login_payload), verify=False)
+        if r.status_code != 200:
+            self.session = None
+            raise TintriNotConnectedException("Not connected to Tintri: " + r.text)
+
+    def reset(self):
+        """Forget the session (so we log in again next time)."""
+        self.session = None
+
+    def get_json(self, url):
+        """Returns the decoded JSON from url, logging in first if we don't have a session, or again if the
+        Tintri has stopped accepting it."""
+        logger = logging.getLogger("tintri")
+        if self.session is None:
+            self.login()
+        # Don't follow redirects, since an expired session is sent to the login page
+        r = self.session.get(url, verify=False, allow_redirects=False)
+        if r.status_code in EXPIRED_STATUS_CODES or r.is_redirect:
+            logger.info("Tintri session has expired (" + str(r.status_code) + "), logging in again.")
+            self.login()
+            r = self.session.get(url, verify=False, allow_redirects=False)
+        if r.status_code != 200:
+            raise TintriNotConnectedException("Error getting " + url + ": " + str(r.status_code) + " " + r.reason)
+        return r.json()
+
+
 class MonitorJSON:
     """This is a simple class passed to Monitor threads so we can access the current JSON data in that thread"""
     def __init__(self):
         self.json = ""
-        self.session = None
+        self.session = TintriSession()
         self.data = TintriData()
 
 
@@ -55,32 +105,9 @@ def generate_json(tintri_monitor):
     logger = logging.getLogger("tintri")
 
     try:
-
-        login_payload = {
-            "typeId": "com.tintri.api.rest.vcommon.dto.rbac.RestApiCredentials",
-            "newPassword": None,
-            "roles": None,
-            "username": TINTRI_USER,
-            "password": TINTRI_PASSWORD
-        }
-        headers = {'content-type': 'application/json'}
-
-        # Here I'm processing the login each interval along with the request.  I tried using the existing
-        # connection, but at some point the Tintri stops accepting the session.  It's messy, but until Tintri
-        # releases some documentation, this is the best way to ensure that it keeps working.
-
-        # Create Session object to persist JSESSIONID cookie (so the next requests to Tintri will work)
-        tintri_monitor.session = requests.Session()
-
-        # For all our requests, use the verify=False to ignore certificate errors
-        logger.debug("Connecting to:" + TINTRI_LOGIN_URL)
-        r = tintri_monitor.session.post(TINTRI_LOGIN_URL, data=json.dumps(login_payload), verify=False, headers=headers)
-        if r.status_code != 200:
-            raise TintriNotConnectedException("Not connected to Tintri: " + r.text)
-
-        # Grab stats data from Tintri
-        r = tintri_monitor.session.get(TINTRI_STATS_SUMMARY, verify=False, headers=headers)
-        summary_stats = (r.json())["tintriObjects"][0]
+        # Grab stats data from Tintri.  The session is kept between intervals, and at some point the Tintri stops
+        # accepting it, so the TintriSession logs in again when the Tintri answers with 401/403 or a redirect.
+        summary_stats = tintri_monitor.session.get_json(TINTRI_STATS_SUMMARY)["tintriObjects"][0]
 
         # Save stat datapoints to our persistent monitor object
         tintri_monitor.data.iops.append(summary_stats["operationsTotalIops"])
@@ -89,22 +116,15 @@ def generate_json(tintri_monitor):
         tintri_monitor.data.flash_hit.append(summary_stats["flashHitPercent"])
         tintri_monitor.data.space_used.append(summary_stats["spaceUsedGiB"])
 
-        # If we already have the max number of datapoints in our list, delete the oldest item
-        if len(tintri_monitor.data.iops) > MAX_DATAPOINTS:
-            del(tintri_monitor.data.iops[0])
-            del(tintri_monitor.data.latency[0])
-            del(tintri_monitor.data.throughput[0])
-            del(tintri_monitor.data.flash_hit[0])
-            del(tintri_monitor.data.space_used[0])
-
         # ====================================
         # Generate JSON output and assign to tintri_monitor object (for return back to caller module)
-        output = json.dumps({"stats": tintri_monitor.data.__dict__})
+        output = json.dumps({"stats": tintri_monitor.data.__dict__}, default=json_default)
         tintri_monitor.json = output
 
     except Exception as error:
         tintri_monitor.json = json.dumps({"error": "Error getting data from Tintri"}, indent=4)
         logger.error("Error getting data from Tintri" + str(error))
+        tintri_monitor.session.reset()      # Start over with a new login next time
 
     logger.debug(tintri_monitor.json)
 
@@ -0,0 +1,61 @@
+"""ttlcache - Shared cache for data that changes more slowly than the modules collect it.
+
+Every module is collected each SAMPLE_INTERVAL, but some of what it reads (storage capacity, growth per day, the ID
+of a report) only changes every few hours.  A module can list those items with their own refresh interval in a
+REFRESH_INTERVALS dictionary in its SETTINGS section, next to SAMPLE_INTERVAL:
+
+    REFRESH_INTERVALS = {
+        "storage": 900,         # Capacity only needs to be read every 15 minutes
+    }
+
+and read them through the shared cache.  fetch is only called when the cached value is older than the refresh
+interval, and the cached value is returned in between.  Items that aren't listed have an interval of 0, so they
+are fetched every time (at SAMPLE_INTERVAL).
+
+    storage = ttlcache.shared_cache.get(NETAPP_URL + "/storage/cluster", fetch_storage,
+                                        REFRESH_INTERVALS.get("storage", 0))
+
+The key should include the server, so modules that read the same item from the same server share the value.
+If fetch raises an exception, nothing is cached and the exception is passed on to the module.
+
+"""
+import threading
+import time
+
+__author__ = 'scott@flakshack.com (Scott Vintinner)'
+
+
+class TTLCache:
+    """Values stored by key, each refreshed by calling its fetch function when it is older than its ttl."""
+
+    def __init__(self):
+        self._values = {}               # key -> (time.monotonic() when fetched, value)
+        self._locks = {}                # key -> Lock (so two modules don't fetch the same item at the same time)
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch, ttl):
+        """Returns the cached value for key if it is less than ttl seconds old, otherwise calls fetch() and caches
+        what it returns.  With a ttl of 0 (or less), fetch() is called every time."""
+        if ttl <= 0:
+            return fetch()
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            cached = self._values.get(key)
+            if cached is not None and time.monotonic() - cached[0] < ttl:
+                return cached[1]
+            value = fetch()
+            self._values[key] = (time.monotonic(), value)
+            return value
+
+    def invalidate(self, key):
+        """Forgets the value for key, so the next get() fetches it again."""
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+shared_cache = TTLCache()       # The cache shared by all of the modules
@@ -0,0 +1,147 @@
+"""vcenter - Shared vCenter connections used by the VMware modules.
+
+Each vCenter server gets a single VCenter object (use VCenter.get), so the VMware modules share one login and one
+session instead of each holding their own SmartConnect session to the same server.  The session is checked before
+it is used (at most every SNAPSHOT_SECONDS) and we log in again if it has expired.
+
+Modules ask for the properties they need with VCenter.properties(obj_type, path_set).  There is one PropertyCache
+per object type for each server, holding every property any module has asked for, so the HostSystem properties
+needed by vmware_host and vmware_vm come from the same update.  The result of each update is a snapshot that is
+shared: any module that asks for the same object type within SNAPSHOT_SECONDS gets the same list without another
+call to vCenter, so all of the VMware panels are served from one collection.
+
+Real-time performance counters come from VCenter.query_perf(entities, counter_names), which uses a
+pchelper.PerfCollector (and its cached counter ID map) for the session.
+
+"""
+import logging
+import ssl
+import threading
+import time
+from pyVim.connect import SmartConnect
+from pchelper import PropertyCache
+from pchelper import PerfCollector
+
+__author__ = 'scott@flakshack.com (Scott Vintinner)'
+
+# =================================SETTINGS======================================
+SNAPSHOT_SECONDS = 15               # Modules asking for the same objects within this many seconds share one update
+# ===============================================================================
+
+
+class VCenterError(Exception):
+    pass
+
+
+class VCenter:
+    """A single vCenter server connection.  Use VCenter.get() so every module shares the same object."""
+    all_servers = {}                    # (server, username) -> VCenter
+    _all_servers_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, server, username, password):
+        """Returns the shared VCenter for this server and username."""
+        key = (server, username)
+        with cls._all_servers_lock:
+            if key not in cls.all_servers:
+                cls.all_servers[key] = cls(server, username, password)
+            return cls.all_servers[key]
+
+    def __init__(self, server, username, password):
+        self.server = server
+        self.username = username
+        self.password = password
+        self.service_instance = None
+        self.last_validated = None      # time.monotonic() when we last checked the session was still logged in
+        self.path_sets = {}             # obj_type -> set of every property any module has asked for
+        self.property_caches = {}       # obj_type -> PropertyCache
+        self.snapshots = {}             # obj_type -> (time.monotonic(), list of properties)
+        self.perf_collector = None      # PerfCollector for this session
+        self.lock = threading.RLock()   # Only one module talks to the server at a time
+
+    def connect(self):
+        """Returns the ServiceInstance, logging in (again) if needed.  Raises VCenterError if we can't connect."""
+        logger = logging.getLogger(__name__)
+        with self.lock:
+            if self.service_instance is not None:
+                if self.last_validated is not None and time.monotonic() - self.last_validated < SNAPSHOT_SECONDS:
+                    return self.service_instance
+                try:
+                    if self.service_instance.content.sessionManager.currentSession:
+                        self.last_validated = time.monotonic()
+                        return self.service_instance
+                    logger.warning("Session to " + self.server + " has expired.")
+                except Exception as error:
+                    logger.warning("Error checking session to " + self.server + ": " + str(error))
+                self._reset()
+
+            # Disable certificate verification otherwise it will error
+            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS)
+            ssl_context.verify_mode = ssl.CERT_NONE
+
+            try:
+                logger.debug("Connecting to: " + self.server)
+                service_instance = SmartConnect(host=self.server, user=self.username,
+                                                pwd=self.password, sslContext=ssl_context)
+                service_instance._stub.connectionPoolTimeout = -1   # Turn the connection timeout off (default 900)
+            except Exception as error:
+                raise VCenterError("Unable to connect to " + self.server + ": " + str(error))
+
+            logger.debug("Connected to " + self.server + " at " +
+                         str(service_instance.content.sessionManager.currentSession.loginTime))
+            self.service_instance = service_instance
+            self.last_validated = time.monotonic()
+            return service_instance
+
+    def _reset(self):
+        """Forget the session and everything that belongs to it (so we log in again next time)."""
+        self.service_instance = None
+        self.last_validated = None
+        self.property_caches = {}
+        self.snapshots = {}
+        self.perf_collector = None
+
+    def properties(self, obj_type, path_set):
+        """Returns a list of properties for all the managed objects of obj_type (the same as
+        pchelper.collect_properties with include_mors=True).  Each dictionary has at least the properties in
+        path_set, and possibly others that other modules have asked for.  The list is shared, so don't change it.
+        Raises VCenterError if we can't connect."""
+        logger = logging.getLogger(__name__)
+        with self.lock:
+            all_paths = self.path_sets.setdefault(obj_type, set())
+            cache = self.property_caches.get(obj_type)
+            if cache is None or not all_paths.issuperset(path_set):
+                # First request for this type, or a module wants a property we aren't collecting yet
+                all_paths.update(path_set)
+                if cache is not None:
+                    cache.destroy()
+                logger.debug("Creating PropertyCache for " + str(obj_type) + " on " + self.server)
+                cache = PropertyCache(self.connect(), obj_type, sorted(all_paths))
+                self.property_caches[obj_type] = cache
+                self.snapshots.pop(obj_type, None)
+
+            snapshot = self.snapshots.get(obj_type)
+            if snapshot is not None and time.monotonic() - snapshot[0] < SNAPSHOT_SECONDS:
+                return snapshot[1]
+
+            try:
+                props = cache.update()      # vCenter only sends what has changed
+            except Exception:
+                # Check the session (and start over with a new cache) next time
+                del self.property_caches[obj_type]
+                self.last_validated = None
+                raise
+            self.snapshots[obj_type] = (time.monotonic(), props)
+            return props
+
+    def query_perf(self, entities, counter_names, instance=""):
+        """Returns the latest real-time sample of each counter for each entity as {moId: {counter name: value}}
+        (see pchelper.PerfCollector.query).  Raises VCenterError if we can't connect."""
+        with self.lock:
+            if self.perf_collector is None:
+                self.perf_collector = PerfCollector(self.connect())
+            try:
+                return self.perf_collector.query(entities, counter_names, instance)
+            except Exception:
+                self.last_validated = None      # Check the session next time
+                raise
@@ -12,14 +12,15 @@
 from credentials import VMWARE_VCENTER_USERNAME
 from credentials import VMWARE_VCENTER_PASSWORD
 import operator
+import heapq
 import time
 import json
 import logging.config
-from pyVim.connect import SmartConnect
-from pchelper import collect_properties
-from pchelper import get_container_view
+from vcenter import VCenter
+from vcenter import VCenterError
+from timeseries import TimeSeries
+from registry import EntityRegistry
 import pyVmomi
-import ssl
 
 __author__ = 'scott@flakshack.com (Scott Vintinner)'
 
@@ -31,6 +32,7 @@ VCENTER_SERVERS = [
 ]
 SAMPLE_INTERVAL = 60
 MAX_DATAPOINTS = 30
+MAX_MISSED_COLLECTIONS = 5       # Forget hosts that vCenter hasn't returned for this many samples
 MAX_HOST_RESULTS = 11
 # ===============================================================================
 
@@ -44,34 +46,37 @@ class MonitorJSON:
 
 
 class ESXHost:
-    all_hosts = []      # Static array containing all hosts
+    all_hosts = EntityRegistry("managed_object_reference", "name")  # Static registry containing all hosts
 
     def __init__(self, managed_object_reference, name):
         self.managed_object_reference = managed_object_reference
         self.name = name
         self.status = 0
-        self.cpu_datapoints = []
+        self.cpu_datapoints = TimeSeries(MAX_DATAPOINTS, "q")
         self.ram = 0
         self.ram_percent = 0
         self.relative_weight = 1
-        self.__class__.all_hosts.append(self)     # Add self to static array
+        self.__class__.all_hosts.add(self)        # Add self to static registry
 
     def update_relative_weight(self):
         """The relative weight is used to determine how much we want to see the data of this Host."""
         self.relative_weight = 1
         # Add up all of the historical cpu datapoints (higher CPU = more weight)
-        for i in self.cpu_datapoints:
-            self.relative_weight += i
+        # (the TimeSeries keeps a running total, so this doesn't have to loop through the history)
+        self.relative_weight += self.cpu_datapoints.total()
         # Multiply by the status value (so VMs with red alarm have most weight)
         self.relative_weight *= (self.status * 10)
 
     @classmethod
     def find_by_name(cls, managed_object_reference, name):
-        for host in cls.all_hosts:
-            if host.name == name:
-                return host
-        # if not found, create one and return it instead
-        return ESXHost(managed_object_reference, name)
+        host = cls.all_hosts.get(managed_object_reference) or cls.all_hosts.find("name", name)
+        if host is None:
+            # if not found, create one and return it instead
+            return ESXHost(managed_object_reference, name)
+        # Keep the history of a host that was renamed or re-added to vCenter (new managed object reference)
+        cls.all_hosts.set(host, "managed_object_reference", managed_object_reference)
+        cls.all_hosts.set(host, "name", name)
+        return cls.all_hosts.seen(host)
 
 
 def hostname_from_fqdn(fqdn):
@@ -80,28 +85,8 @@ def hostname_from_fqdn(fqdn):
     return split_fqdn[0]
 
 
-def connect_vcenter(vcenter_server, vcenter_username, vcenter_password):
-    """This function will connect to the specified vCenter server."""
-    logger = logging.getLogger(__name__)
-
-    # Disable certificate verification otherwise it will error
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS)
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    server_instance = None
-    try:
-        logger.debug("Connecting to: " + vcenter_server)
-        server_instance = SmartConnect(host=vcenter_server, user=vcenter_username,
-                                       pwd=vcenter_password, sslContext=ssl_context)
-        server_instance._stub.connectionPoolTimeout = -1    # Turn the connection timeout off (default 900 sec)
-    except Exception as error:
-        logger.error("Error connecting to " + vcenter_server + str(error))
-
-    return server_instance
-
-
-def update_host_data(server):
-    """This function is called to update the HOST data for the specified vcenter server"""
+def update_host_data(vcenter):
+    """This function is called to update the HOST data for the specified (shared) vcenter server"""
     logger = logging.getLogger(__name__)
     # API:  HostSystem -
     # https://pubs.vmware.com/vsphere-51/index.jsp#com.vmware.wssdk.apiref.doc/vim.HostSystem.html
@@ -113,8 +98,7 @@ def update_host_data(server):
     try:
         # Fast way of getting Host properties using PropertyCollector
         # https://github.com/vmware/pyvmomi/blob/master/docs/vmodl/query/PropertyCollector.rst
-        logger.debug("Getting PropertyCollector for " + server["name"])
-        container_view = get_container_view(server["conn"], obj_type=[pyVmomi.vim.HostSystem])
+        logger.debug("Getting PropertyCollector for " + vcenter.server)
         query = [
             "name",
             "summary.overallStatus",
@@ -122,11 +106,10 @@ def update_host_data(server):
             "summary.quickStats.overallMemoryUsage",
             "hardware.memorySize"
         ]
-        props = collect_properties(server["conn"], container_view,
-                                   pyVmomi.vim.HostSystem, query, include_mors=True)
+        props = vcenter.properties(pyVmomi.vim.HostSystem, query)     # Shared with the other VMware modules
 
     except Exception as error:
-        logger.error("Error collecting VMware Host data from " + server["name"] + str(error))
+        logger.error("Error collecting VMware Host data from " + vcenter.server + str(error))
         raise
 
     # Loop through all of the ESX servers in props
@@ -165,13 +148,7 @@ def update_host_data(server):
         host.ram_percent = host_ram_percent
 
         # For CPU datapoints, we want to do a line graph, so we need a history
-        if len(host.cpu_datapoints) == 0:                # first time through, initialize the list
-            host.cpu_datapoints = [host_cpu]
-        else:
-            host.cpu_datapoints.append(host_cpu)
-        # If we already have the max number of datapoints in our list, delete the oldest item
-        if len(host.cpu_datapoints) >= MAX_DATAPOINTS:
-            del(host.cpu_datapoints[0])
+        host.cpu_datapoints.append(host_cpu)
 
         # Update ranking value of this Host to determine if we should show it
         host.update_relative_weight()
@@ -186,27 +163,15 @@ def generate_json(vmware_monitor):
     logger = logging.getLogger("vmware_host")
 
     # Process each vcenter server
+    ESXHost.all_hosts.next_generation()
     for server in vmware_monitor.vcenter_servers:
         logger.debug("Starting " + server["name"])
-        if "conn" not in server:
-            logger.debug(server["name"] + " not currently connected.")
-            server["conn"] = connect_vcenter(server["name"], server["username"], server["password"])
-
-        if server["conn"] is None:
-            logger.warning("Unable to connect to " + server["name"] + " will retry in " +
-                        str(SAMPLE_INTERVAL) + " seconds.")
-            vmware_monitor.json = json.dumps({"vms": [{"error": "Unable to connect to " + server["name"] +
-                                                                " will retry in " + str(SAMPLE_INTERVAL) +
-                                                                " seconds."}]}, indent=4)
-            return vmware_monitor   # Could not connect so return
-
-        # Final test if we're connected
+        # Get the shared connection to the vCenter server (it will log in again if the session has expired)
+        vcenter = VCenter.get(server["name"], server["username"], server["password"])
         try:
-            if server["conn"].content.sessionManager.currentSession:
-                logger.debug("Connected to " + server["name"] + " at " +
-                            str(server["conn"].content.sessionManager.currentSession.loginTime))
-        except Exception as error:
-            logger.error("Final test: Error connecting to " + server["name"] + str(error))
+            vcenter.connect()
+        except VCenterError as error:
+            logger.warning(str(error) + " will retry in " + str(SAMPLE_INTERVAL) + " seconds.")
             vmware_monitor.json = json.dumps({"vms": [{"error": "Unable to connect to " + server["name"] +
                                                                 " will retry in " + str(SAMPLE_INTERVAL) +
                                                                 " seconds."}]}, indent=4)
@@ -214,7 +179,7 @@ def generate_json(vmware_monitor):
 
         # Update all the ESX host objects for the specified vCenter server
         try:
-            update_host_data(server)
+            update_host_data(vcenter)
         except Exception as error:
             logger.error("Error updating data from " + server["name"] + str(error))
             vmware_monitor.json = json.dumps({"vms": [{"error": "Error updating data from " + server["name"] +
@@ -222,25 +187,26 @@ def generate_json(vmware_monitor):
                                                                 " seconds."}]}, indent=4)
             return vmware_monitor
 
-    # Sort by relative weight
-    ESXHost.all_hosts.sort(key=operator.attrgetter('relative_weight'), reverse=True)
+    # Forget the hosts that have been removed from vCenter
+    for host in ESXHost.all_hosts.evict(MAX_MISSED_COLLECTIONS):
+        logger.debug("Removing host: " + host.name)
+
+    # Pick the MAX_HOST_RESULTS hosts with the highest relative weight
+    top_hosts = heapq.nlargest(MAX_HOST_RESULTS, ESXHost.all_hosts, key=operator.attrgetter('relative_weight'))
 
     # We have all the data we need, so format and set output
     host_data = []
-    for i, host in enumerate(ESXHost.all_hosts):
+    for host in top_hosts:
 
         # Generate the data sequence
         host_data.append({
             "name": host.name,
             "status": host.status,
-            "cpu": host.cpu_datapoints,
+            "cpu": host.cpu_datapoints.values(),
             "ram": host.ram,
             "ram_percent": host.ram_percent
         })
 
-        if i >= (MAX_HOST_RESULTS - 1):   # Don't return more hosts than we need
-            break
-
     vmware_monitor.json = json.dumps({"hosts": host_data})
 
     if __debug__:
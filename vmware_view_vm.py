@@ -11,14 +11,15 @@
 from credentials import VMWARE_VCENTER_USERNAME
 from credentials import VMWARE_VCENTER_PASSWORD
 import operator
+import heapq
 import time
 import json
 import logging.config
-from pyVim.connect import SmartConnect
-from pchelper import collect_properties
-from pchelper import get_container_view
+from vcenter import VCenter
+from vcenter import VCenterError
+from timeseries import TimeSeries
+from registry import EntityRegistry
 import pyVmomi
-import ssl
 
 __author__ = 'scott@flakshack.com (Scott Vintinner)'
 
@@ -28,6 +29,7 @@ VCENTER_USERNAME = VMWARE_VCENTER_USERNAME
 VCENTER_PASSWORD = VMWARE_VCENTER_PASSWORD
 SAMPLE_INTERVAL = 60
 MAX_DATAPOINTS = 30
+MAX_MISSED_COLLECTIONS = 5       # Forget VMs and hosts that vCenter hasn't returned for this many samples
 MAX_VM_RESULTS = 23              # Number of VMs to get data (should match html file)
 EXCLUDE_VM = ["NTNX"]            # VMs with any of the items in this list in their
 #                                  name will be excluded from results
@@ -42,98 +44,80 @@ class MonitorJSON:
         for i in range(MAX_VM_RESULTS):
             vms.append({"name": "----", "status": 0, "cpu": [0, 0, 0, 0]})
         self.json = json.dumps({"vms": vms}, indent=4)
-        self.conn = None     # Will store the connection object for vSphere
 
 
 class VMwareVM:
-    all_vms = []      # Static array containing all hosts
+    all_vms = EntityRegistry("managed_object_reference", "name")    # Static registry containing all VMs
 
     def __init__(self, managed_object_reference, name):
         self.managed_object_reference = managed_object_reference
         self.name = name
-        self.cpu_datapoints = []
+        self.cpu_datapoints = TimeSeries(MAX_DATAPOINTS, "q")
         self.cpu_count = 1                      # Number of vCPUs
         self.host_cpu_mhz = 1.0                 # Host CPU speed
         self.heartbeat_status = 0
         self.relative_weight = 0.0
-        self.__class__.all_vms.append(self)     # Add self to static array
+        self.__class__.all_vms.add(self)        # Add self to static registry
 
     @classmethod
     def find_by_name(cls, managed_object_reference, name):
-        for vm in cls.all_vms:
-            if vm.name == name:
-                return vm
-        # if not found, create one and return it instead
-        return VMwareVM(managed_object_reference, name)
+        vm = cls.all_vms.get(managed_object_reference) or cls.all_vms.find("name", name)
+        if vm is None:
+            # if not found, create one and return it instead
+            return VMwareVM(managed_object_reference, name)
+        # Keep the history of a VM that was renamed or re-registered (new managed object reference)
+        cls.all_vms.set(vm, "managed_object_reference", managed_object_reference)
+        cls.all_vms.set(vm, "name", name)
+        return cls.all_vms.seen(vm)
 
     def update_relative_weight(self):
         """The relative weight is used to determine how much we want to see the data of this VM."""
         self.relative_weight = 1
         # Add up all of the historical cpu datapoints (higher CPU = more weight)
-        for i in self.cpu_datapoints:
-            self.relative_weight += i
+        # (the TimeSeries keeps a running total, so this doesn't have to loop through the history)
+        self.relative_weight += self.cpu_datapoints.total()
         # Multiply by the status value (so VMs with red alarm have most weight)
         self.relative_weight *= (self.heartbeat_status * 10)
 
 
 class VMwareHost:
     """In order to calculate CPU used percent for VMs, we need to know Mhz speed of Host.  We update this list
-    to make our search faster.  It is stored as a static array to persist across calls to this module."""
-    all_hosts = []      # Static array containing all hosts
+    to make our search faster.  It is stored as a static registry to persist across calls to this module."""
+    all_hosts = EntityRegistry("managed_object_reference")      # Static registry containing all hosts
 
     def __init__(self, managed_object_reference, name, hz):
         self.managed_object_reference = managed_object_reference
         self.name = name
         self.cpu_mhz = int(hz / (1000 * 1000))         # CPU speed
-        self.__class__.all_hosts.append(self)           # Add self to static array
+        self.__class__.all_hosts.add(self)              # Add self to static registry
 
     @classmethod
     def get_mhz_by_host(cls, managed_object_reference):
-        for host in cls.all_hosts:
-            if host.managed_object_reference == managed_object_reference:
-                return host.cpu_mhz
+        host = cls.all_hosts.get(managed_object_reference)
+        if host is not None:
+            return host.cpu_mhz
 
-
-def connect_vcenter():
-    """This function will connect to the specified vCenter server.  If it fails, it will retry"""
-    logger = logging.getLogger(__name__)
-    # Disable certificate verification otherwise it will error
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS)
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    server_instance = None
-    try:
-        logger.debug("Connecting to: " + VCENTER_SERVER)
-        server_instance = SmartConnect(host=VCENTER_SERVER, user=VCENTER_USERNAME,
-                                       pwd=VCENTER_PASSWORD, sslContext=ssl_context)
-        server_instance._stub.connectionPoolTimeout = -1    # Turn the connection timeout off (default 900 sec)
-    except Exception as error:
-        logger.error("Error connecting to " + VCENTER_SERVER + str(error))
-
-    return server_instance
+    @classmethod
+    def update(cls, managed_object_reference, name, hz):
+        """Find the host by managed object reference (or create one if not found) and update its data."""
+        host = cls.all_hosts.get(managed_object_reference)
+        if host is None:
+            return VMwareHost(managed_object_reference, name, hz)
+        host.name = name
+        host.cpu_mhz = int(hz / (1000 * 1000))
+        return cls.all_hosts.seen(host)
 
 
 def generate_json(vmware_monitor):
     """This is the main function. It will connect to the vCenter server, obtain perf data and output json"""
     logger = logging.getLogger("vmware_view_vm")
 
-    if vmware_monitor.conn is None:
-        vmware_monitor.conn = connect_vcenter()     # Connect to vCenter server
-        if vmware_monitor.conn is None:
-            logger.warning("Unable to connect to " + VCENTER_SERVER + " will retry in " +
-                        str(SAMPLE_INTERVAL) + " seconds.")
-            vmware_monitor.json = json.dumps({"vms": [{"error": "Unable to connect to " + VCENTER_SERVER +
-                                                       " will retry in " + str(SAMPLE_INTERVAL) +
-                                                       " seconds."}]}, indent=4)
-            return vmware_monitor   # Could not connect so return
-
-    # Final test if we're connected
+    # Get the shared connection to the vCenter server (it will log in again if the session has expired)
+    vcenter = VCenter.get(VCENTER_SERVER, VCENTER_USERNAME, VCENTER_PASSWORD)
     try:
-        if vmware_monitor.conn.content.sessionManager.currentSession:
-            logger.debug("Connected to " + VCENTER_SERVER + " at " +
-                        str(vmware_monitor.conn.content.sessionManager.currentSession.loginTime))
-    except Exception as error:
-        logger.error("Final test: Error connecting to " + VCENTER_SERVER + str(error))
+        vcenter.connect()
+    except VCenterError as error:
+        logger.warning(str(error) + " will retry in " + str(SAMPLE_INTERVAL) + " seconds.")
         vmware_monitor.json = json.dumps({"vms": [{"error": "Unable to connect to " + VCENTER_SERVER +
                                                             " will retry in " + str(SAMPLE_INTERVAL) +
                                                             " seconds."}]}, indent=4)
@@ -151,10 +135,8 @@ def generate_json(vmware_monitor):
         # https://github.com/vmware/pyvmomi/blob/master/docs/vmodl/query/PropertyCollector.rst
 
         logger.debug("Collecting properties for HostSystem")
-        container_view = get_container_view(vmware_monitor.conn, obj_type=[pyVmomi.vim.HostSystem])
         query = ["name", "hardware.cpuInfo.hz"]
-        host_props = collect_properties(vmware_monitor.conn, container_view,
-                                        pyVmomi.vim.HostSystem, query, include_mors=True)
+        host_props = vcenter.properties(pyVmomi.vim.HostSystem, query)     # Shared with the other VMware modules
 
     except Exception as error:
         logger.error("Error collecting VMware Host data." + str(error))
@@ -162,14 +144,15 @@ def generate_json(vmware_monitor):
                                                             str(error)}]}, indent=4)
         return vmware_monitor
 
+    VMwareHost.all_hosts.next_generation()
     for prop_set in host_props:
         # The properties aren't always returned in the order you expect, so we have to match them up
         host_mor = prop_set["obj"]
         host_name = prop_set["name"]
         host_hz = prop_set["hardware.cpuInfo.hz"]
         logger.debug("Name: " + host_name + " cpuInfo.hz: " + str(host_hz))
-        # Create host object so we can find Mhz later (object is stored in class array all_hosts)
-        VMwareHost(host_mor, host_name, host_hz)
+        # Update host object so we can find Mhz later (object is stored in class registry all_hosts)
+        VMwareHost.update(host_mor, host_name, host_hz)
 
     # ---------------------------------------------------------------------------------------------------------------
     #
@@ -192,7 +175,6 @@ def generate_json(vmware_monitor):
         # https://github.com/vmware/pyvmomi/blob/master/docs/vmodl/query/PropertyCollector.rst
 
         logger.debug("Collecting properties for VirtualMachine")
-        container_view = get_container_view(vmware_monitor.conn, obj_type=[pyVmomi.vim.VirtualMachine])
         query = [
             "name",
             "summary.overallStatus",
@@ -200,8 +182,7 @@ def generate_json(vmware_monitor):
             "config.hardware.numCPU",  # This number is vCPU
             "runtime.host"
         ]
-        props = collect_properties(vmware_monitor.conn, container_view,
-                                        pyVmomi.vim.VirtualMachine, query, include_mors=True)
+        props = vcenter.properties(pyVmomi.vim.VirtualMachine, query)     # Shared with the other VMware modules
 
     except Exception as error:
         logger.error("Error collecting VMware VirtualMachine data." + str(error))
@@ -209,12 +190,25 @@ def generate_json(vmware_monitor):
                                                             str(error)}]}, indent=4)
         return vmware_monitor
 
+    # Get the real-time (20 second) CPU usage of the VMs, which is more up to date than quickStats.  The VMs are
+    # batched into a few QueryPerf calls.  If this fails, we still have the quickStats value.
+    vm_mors = [prop_set["obj"] for prop_set in props
+               if not any(substring in prop_set["name"] for substring in EXCLUDE_VM)]
+    try:
+        vm_perf = vcenter.query_perf(vm_mors, ["cpu.usagemhz.average"])
+    except Exception as error:
+        logger.warning("Error collecting real-time CPU stats, using quickStats instead. " + str(error))
+        vm_perf = {}
+
     # Loop through all of the VMs
+    VMwareVM.all_vms.next_generation()
     for prop_set in props:
         mor = prop_set["obj"]  # managed_object_reference
         vm_name = prop_set["name"]
         vm_status = prop_set["summary.overallStatus"]
         vm_cpu = prop_set["summary.quickStats.overallCpuUsage"]
+        if mor._moId in vm_perf:
+            vm_cpu = vm_perf[mor._moId].get("cpu.usagemhz.average", vm_cpu)
         vm_cpu_count = prop_set["config.hardware.numCPU"]
         vm_host_mor = prop_set["runtime.host"]      # managed_object_reference for its host
 
@@ -237,36 +231,32 @@ def generate_json(vmware_monitor):
             vm.heartbeat_status = 0
 
         # Store the cpu data in the object
-        if len(vm.cpu_datapoints) == 0:
-            vm.cpu_datapoints = [vm_cpu]
-        else:
-            vm.cpu_datapoints.append(vm_cpu)
-        # If we already have the max number of datapoints in our list, delete the oldest item
-        if len(vm.cpu_datapoints) >= MAX_DATAPOINTS:
-            del (vm.cpu_datapoints[0])
+        vm.cpu_datapoints.append(vm_cpu)
 
         vm.host_cpu_mhz = VMwareHost.get_mhz_by_host(vm_host_mor)  # Get the host hz per CPU
         vm.cpu_count = vm_cpu_count
         # Update ranking value of this VM to determine if we should show it
         vm.update_relative_weight()
 
-    # Once we have finished updating our VM data, grab the top MAX_VM_RESULTS and output the JSON
-    # Sort by relative weight
-    VMwareVM.all_vms.sort(key=operator.attrgetter('relative_weight'), reverse=True)
+    # Forget the VMs and hosts that have been removed from vCenter
+    for vm in VMwareVM.all_vms.evict(MAX_MISSED_COLLECTIONS):
+        logger.debug("Removing VM: " + vm.name)
+    for host in VMwareHost.all_hosts.evict(MAX_MISSED_COLLECTIONS):
+        logger.debug("Removing host: " + host.name)
 
-    # If there are fewer VMs than we've asked it to display, fix the MAX_VM_RESULTS
-    global MAX_VM_RESULTS
-    if len(VMwareVM.all_vms) < MAX_VM_RESULTS:
-        MAX_VM_RESULTS = len(VMwareVM.all_vms)
+    # Once we have finished updating our VM data, grab the top MAX_VM_RESULTS and output the JSON
+    # This keeps a heap of MAX_VM_RESULTS items rather than sorting every VM (and returns all of them if there are
+    # fewer VMs than we've asked it to display).
+    top_vms = heapq.nlargest(MAX_VM_RESULTS, VMwareVM.all_vms, key=operator.attrgetter('relative_weight'))
 
     vms = []
-    for i in range(MAX_VM_RESULTS):
+    for vm in top_vms:
         vms.append({
-            "name": VMwareVM.all_vms[i].name,
-            "status": VMwareVM.all_vms[i].heartbeat_status,
-            "cpu": VMwareVM.all_vms[i].cpu_datapoints,
-            "cpu_count": VMwareVM.all_vms[i].cpu_count,
-            "host_cpu_mhz": VMwareVM.all_vms[i].host_cpu_mhz,
+            "name": vm.name,
+            "status": vm.heartbeat_status,
+            "cpu": vm.cpu_datapoints.values(),
+            "cpu_count": vm.cpu_count,
+            "host_cpu_mhz": vm.host_cpu_mhz,
         })
 
     vmware_monitor.json = json.dumps({"vms": vms})
@@ -12,11 +12,41 @@ themselves first.
 
 import cherrypy
 from cherrypy.lib.static import serve_file
+import asyncio
+import gzip
+import hashlib
 import os
 import json
+import threading
 import logging.config
 import requests
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
+from scheduler import AsyncCollectionLoop
+from scheduler import CollectionScheduler
+
+# =================================SETTINGS======================================
+WORKER_THREADS = 4          # Number of threads used to collect data for all of the modules
+SCHEDULER_JITTER = 5        # Max random delay (seconds) so modules don't all collect on the same second
+DEADLINE_FACTOR = 2         # A collection is overdue when it runs longer than SAMPLE_INTERVAL * DEADLINE_FACTOR
+ENABLE_ASYNCIO = True       # Run modules with an async generate_json on a shared asyncio event loop
+ASYNCIO_EXECUTOR_THREADS = 4    # Threads available to async modules for blocking calls (run_in_executor)
+SERVER_THREADS = 30         # CherryPy request threads.  Each display's /ajax/events connection holds one open.
+EVENTS_KEEPALIVE = 15       # Seconds between keep-alive comments on idle /ajax/events connections
+# ===============================================================================
+
+
+class EncodedResponse:
+    """An immutable, pre-encoded copy of a module's JSON data.  This is built once per collection cycle so the
+    /ajax handler doesn't have to encode (or compress) the same string for every request."""
+    __slots__ = ("json", "body", "gzip_body", "version", "etag")
+
+    def __init__(self, json_text):
+        self.json = json_text
+        self.body = json_text.encode('utf8')            # In Python3 data has to be utf8 encoded
+        self.gzip_body = gzip.compress(self.body)
+        self.version = hashlib.sha1(self.body).hexdigest()
+        # Weak ETag, since the plain and gzip bodies are equivalent representations of the same data
+        self.etag = 'W/"' + self.version + '"'
 
 
 class SysAdminBoardModule:
@@ -24,34 +54,73 @@ class SysAdminBoardModule:
         with CherryPy to gather data.
     """
     all_modules = []      # Static array containing all modules
+    modules_by_name = {}  # Static dict to look up modules by name (for the batch URL)
+    update_condition = threading.Condition()    # Notified whenever any module publishes new data
+    update_count = 0                            # Incremented whenever any module publishes new data
 
-    def __init__(self, module_name):
+    def __init__(self, module_name, source_module=None):
         logger = logging.getLogger("SysAdminBoardModule")
         # Dynamically import the python module file
         self.module_name = module_name
-        logger.info("Importing module: " + module_name)
-        self.module = __import__(module_name)
+        if source_module is None:
+            logger.info("Importing module: " + module_name)
+            self.module = __import__(module_name)
+            self.data = self.module.MonitorJSON()            # Custom class to store the JSON data
+        else:
+            # One python module can provide several panels (see INSTANCES in nutanix_vm.py).  Its MonitorJSON is
+            # given the panel name so it can look up the settings for that panel.
+            logger.info("Importing module: " + source_module + " for " + module_name)
+            self.module = __import__(source_module)
+            self.data = self.module.MonitorJSON(module_name)
         self.frequency = self.module.SAMPLE_INTERVAL
-        self.data = self.module.MonitorJSON()            # Custom class to store the JSON data
+        # Modules can define generate_json as a coroutine (async def) to run on the asyncio loop
+        self.is_async = asyncio.iscoroutinefunction(self.module.generate_json)
+        self.response = None                            # EncodedResponse served by /ajax
+        self.publish()
 
-        # Add a thread in CherryPy to execute our callback funciton
-        logger.debug("Creating callback function for:  " + module_name)
-        cherrypy.process.plugins.Monitor(cherrypy.engine, self.callback_function, frequency=self.frequency).subscribe()
-
-        # Rather than wait for the first CherryPy timer to trigger, we'll gather the first set of data now
-        logger.debug("First run of: " + module_name)
-        try:
-            self.callback_function()
-        except Exception as error:
-            # No matter what exception we hit here, we don't want this to stop other modules from running.
-            logger.error("Error setting callback function " + str(error))
-            pass
+        # Add this module to the shared collection scheduler (instead of creating a thread for each module).
+        # The first run happens in the background as soon as the engine starts, so the web server can answer
+        # right away.  Until then, /ajax returns the placeholder JSON from MonitorJSON.
+        logger.debug("Scheduling callback function for:  " + module_name)
+        scheduler.add(self)
 
         self.__class__.all_modules.append(self)     # Add self to static array
+        self.__class__.modules_by_name[module_name] = self
 
-    # Define the callback function that CherryPy will call every interval to gather data
+    # Define the callback function that the scheduler will call every interval to gather data
     def callback_function(self):
-        self.module.generate_json(self.data)
+        if self.is_async:
+            # No event loop available in this thread, so run the coroutine on a private loop
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.callback_coroutine())
+            finally:
+                loop.close()
+        else:
+            try:
+                self.module.generate_json(self.data)
+            finally:
+                self.publish()
+
+    # Define the coroutine that the asyncio loop will run every interval for modules with an async generate_json
+    async def callback_coroutine(self):
+        try:
+            await self.module.generate_json(self.data)
+        finally:
+            self.publish()
+
+    def publish(self):
+        """Encode the module's current JSON for the /ajax handler (only if it has changed)."""
+        json_text = self.data.json
+        if not json_text:
+            # Some modules don't have placeholder data, so let the page know we're still waiting on the first run
+            json_text = json.dumps({"error": "Waiting for first data collection..."})
+        if self.response is None or self.response.json != json_text:
+            self.response = EncodedResponse(json_text)
+            # Wake up any /ajax/events connections so they push the new data right away
+            with SysAdminBoardModule.update_condition:
+                SysAdminBoardModule.update_count += 1
+                SysAdminBoardModule.update_condition.notify_all()
 
     # Define a web URL to return the static file (named with module_name.html)
     @cherrypy.expose
@@ -62,8 +131,35 @@ class SysAdminBoardModule:
     @cherrypy.expose
     def ajax(self, **params):
         # cherrypy.response.headers["Access-Control-Allow-Origin"] = "*"  # Bypass Javascript security for testing only
+        response = self.response
         cherrypy.response.headers['Content-Type'] = 'application/json'
-        return self.data.json.encode('utf8')            # In Python3 data has to be utf8 encoded
+        cherrypy.response.headers['Cache-Control'] = 'no-cache'     # Browser must revalidate with the ETag
+        cherrypy.response.headers['Vary'] = 'Accept-Encoding'
+        cherrypy.response.headers['ETag'] = response.etag
+
+        # If the browser already has this version of the data, there's nothing to send
+        if_none_match = cherrypy.request.headers.get('If-None-Match', '')
+        if response.etag in [tag.strip() for tag in if_none_match.split(',')]:
+            cherrypy.response.status = 304
+            return b''
+
+        if 'gzip' in cherrypy.request.headers.get('Accept-Encoding', ''):
+            cherrypy.response.headers['Content-Encoding'] = 'gzip'
+            return response.gzip_body
+        return response.body
+
+
+def module_event(sb_module, response):
+    """Format a module's data as a Server-Sent Event.  Every line of the data has to start with 'data: '."""
+    payload = ('{"module": ' + json.dumps(sb_module.module_name) + ', "version": "' + response.version +
+               '", "data": ' + response.json + '}')
+    return ('event: update\ndata: ' + payload.replace('\n', '\ndata: ') + '\n\n').encode('utf8')
+
+
+def unknown_module_event(module_name):
+    """Format the event sent for a module name that isn't enabled (like the error in /ajax/batch)."""
+    payload = '{"module": ' + json.dumps(module_name) + ', "error": "Unknown module"}'
+    return ('event: update\ndata: ' + payload + '\n\n').encode('utf8')
 
 
 class MyWebServer(object):
@@ -82,7 +178,8 @@ class MyWebServer(object):
             <li><a href="/static/ns2.html">http://""" + hostname + """/static/ns2.html</a></li>
             </ul>
             
-            <p>Here is a list of active modules and data sources:</p>"""
+            <p>Here is a list of active modules and data sources:</p>
+            <a href="/ajax/batch">All modules Ajax Data (batch)</a><br/>"""
 
         for sb_module in SysAdminBoardModule.all_modules:
             html += '<a href="/' + sb_module.module_name + '?desktop">' + sb_module.module_name + '</a><br/>'
@@ -90,6 +187,85 @@ class MyWebServer(object):
 
         return html
 
+    # Define a web URL to return the latest data for several modules in a single request.
+    # /ajax/batch?modules=a,b,c&versions=va,vb,vc
+    # versions is optional and lists the version the page already has for each module (in the same order).  Modules
+    # whose data hasn't changed are returned with only their version, without the data.
+    @cherrypy.expose
+    def batch(self, modules="", versions="", **params):
+        if modules:
+            module_names = modules.split(',')
+        else:
+            module_names = [sb_module.module_name for sb_module in SysAdminBoardModule.all_modules]
+        known_versions = versions.split(',')
+
+        # The module data is already JSON, so we build the output by hand rather than decoding and encoding it again
+        output = []
+        for i, module_name in enumerate(module_names):
+            sb_module = SysAdminBoardModule.modules_by_name.get(module_name)
+            if sb_module is None:
+                output.append(json.dumps(module_name) + ': {"error": "Unknown module"}')
+                continue
+            response = sb_module.response
+            if i < len(known_versions) and known_versions[i] == response.version:
+                output.append(json.dumps(module_name) + ': {"version": "' + response.version + '"}')
+            else:
+                output.append(json.dumps(module_name) + ': {"version": "' + response.version +
+                              '", "data": ' + response.json + '}')
+        body = ('{"modules": {' + ', '.join(output) + '}}').encode('utf8')
+
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        cherrypy.response.headers['Cache-Control'] = 'no-cache'
+        cherrypy.response.headers['Vary'] = 'Accept-Encoding'
+        if 'gzip' in cherrypy.request.headers.get('Accept-Encoding', ''):
+            cherrypy.response.headers['Content-Encoding'] = 'gzip'
+            return gzip.compress(body)
+        return body
+
+    # Define a web URL that pushes module data to the browser as soon as it changes (Server-Sent Events).
+    # /ajax/events?modules=a,b,c
+    # The current data for each module is sent when the page connects, then again each time a module's
+    # generate_json produces new data.  Module names that aren't enabled get a single "Unknown module" error.
+    @cherrypy.expose
+    def events(self, modules="", **params):
+        unknown_modules = []
+        if modules:
+            sb_modules = []
+            for module_name in modules.split(','):
+                if module_name in SysAdminBoardModule.modules_by_name:
+                    sb_modules.append(SysAdminBoardModule.modules_by_name[module_name])
+                else:
+                    unknown_modules.append(module_name)
+        else:
+            sb_modules = list(SysAdminBoardModule.all_modules)
+
+        cherrypy.response.headers['Content-Type'] = 'text/event-stream'
+        cherrypy.response.headers['Cache-Control'] = 'no-cache'
+        cherrypy.response.headers['X-Accel-Buffering'] = 'no'      # Don't let a reverse proxy hold the events
+
+        def stream():
+            sent_versions = {}
+            yield ('retry: ' + str(EVENTS_KEEPALIVE * 1000) + '\n\n').encode('utf8')
+            for module_name in unknown_modules:
+                yield unknown_module_event(module_name)
+            while cherrypy.engine.state == cherrypy.engine.states.STARTED:
+                # Note the update count before we look, so we can't miss an update that happens while we're sending
+                update_count = SysAdminBoardModule.update_count
+                for sb_module in sb_modules:
+                    response = sb_module.response
+                    if sent_versions.get(sb_module.module_name) != response.version:
+                        sent_versions[sb_module.module_name] = response.version
+                        yield module_event(sb_module, response)
+
+                with SysAdminBoardModule.update_condition:
+                    if SysAdminBoardModule.update_count == update_count:
+                        SysAdminBoardModule.update_condition.wait(EVENTS_KEEPALIVE)
+                    idle = SysAdminBoardModule.update_count == update_count
+                if idle:
+                    yield b': keep-alive\n\n'     # Comment line, so the connection isn't closed as idle
+        return stream()
+    events._cp_config = {'response.stream': True}
+
 # =================MAIN==============
 
 # Setup logging to capture errors
@@ -111,6 +287,15 @@ logger = logging.getLogger("SysAdminBoard Main")
 logger.warn("Disabling SSL certificate verification log messages")
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
+# All modules share a single scheduler with a fixed pool of worker threads
+async_loop = None
+if ENABLE_ASYNCIO:
+    async_loop = AsyncCollectionLoop(cherrypy.engine, executor_threads=ASYNCIO_EXECUTOR_THREADS)
+    async_loop.subscribe()
+scheduler = CollectionScheduler(cherrypy.engine, workers=WORKER_THREADS, jitter=SCHEDULER_JITTER,
+                                deadline_factor=DEADLINE_FACTOR, async_loop=async_loop)
+scheduler.subscribe()
+
 
 # =====================================================================================================
 #
@@ -120,6 +305,7 @@ requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 #
 #  ====================================================================================================
 # Specify the modules you want to execute.  (put a # comment in front of modules to disable them).
+# Modules that provide several panels are listed once for each panel, with the panel name first and then the module.
 
 SysAdminBoardModule('sample')
 # SysAdminBoardModule('msexchange')
@@ -139,14 +325,14 @@ SysAdminBoardModule('sample')
 # SysAdminBoardModule('vmware_view_host')
 # SysAdminBoardModule('vmware_view_vm')
 # SysAdminBoardModule('vmware_vm')
-# SysAdminBoardModule('nutanix_vdi')
-# SysAdminBoardModule('nutanix_svr')
-# SysAdminBoardModule('nutanix_vm_vdi')
-# SysAdminBoardModule('nutanix_vm_svr')
-# SysAdminBoardModule('nutanix_svr_vm_cpu_ready')
-# SysAdminBoardModule('nutanix_vdi_vm_cpu_ready')
-# SysAdminBoardModule('vmware_vm_nutanix_cvm_vdi')
-# SysAdminBoardModule('vmware_vm_nutanix_cvm_svr')
+# SysAdminBoardModule('nutanix_vdi', 'nutanix_cluster')
+# SysAdminBoardModule('nutanix_svr', 'nutanix_cluster')
+# SysAdminBoardModule('nutanix_vm_vdi', 'nutanix_vm')
+# SysAdminBoardModule('nutanix_vm_svr', 'nutanix_vm')
+# SysAdminBoardModule('nutanix_svr_vm_cpu_ready', 'nutanix_vm')
+# SysAdminBoardModule('nutanix_vdi_vm_cpu_ready', 'nutanix_vm')
+# SysAdminBoardModule('vmware_vm_nutanix_cvm_vdi', 'vmware_vm_nutanix_cvm')
+# SysAdminBoardModule('vmware_vm_nutanix_cvm_svr', 'vmware_vm_nutanix_cvm')
 # SysAdminBoardModule('netapp')
 
 
@@ -158,14 +344,18 @@ root = MyWebServer()
 
 mapper = cherrypy.dispatch.RoutesDispatcher()  # Used to manually map URLs to functions in CherryPy
 
+# The root URL:  http://server/
+mapper.connect("index", "/", controller=root, action='index')
+# The batch URL used by layout pages to get data for all of their modules at once:  http://server/ajax/batch
+mapper.connect("batch", "/ajax/batch", controller=root, action='batch')
+# The push URL used by layout pages to receive new data as soon as it is collected:  http://server/ajax/events
+mapper.connect("events", "/ajax/events", controller=root, action='events')
+
 # Loop through all of the modules we've enabled and establish a CherryPy URL using the RoutesDispatcher.
 # The URLs are based on the module name.  For example, if the module name is vmware_host, then the URLs will be:
 # http://server/vmware_host and http://server/vmware_host/ajax
-
 for sysadminboard_module in SysAdminBoardModule.all_modules:
     logger.debug("Mapping module: " + sysadminboard_module.module_name + " to webserver routes / & /ajax")
-    # The root URL:  http://server/
-    mapper.connect("index", "/", controller=root, action='index')
     mapper.connect(sysadminboard_module.module_name, "/" + sysadminboard_module.module_name,
                    controller=sysadminboard_module, action='index')
     mapper.connect(sysadminboard_module.module_name + '/ajax', "/" + sysadminboard_module.module_name + '/ajax',
@@ -194,5 +384,6 @@ CONFIG = {
 logger.info("Starting up SysAdminBoard web server...")
 cherrypy.log.access_log.propagate = False                        # Disable access logging
 cherrypy.config.update({'server.socket_host': '0.0.0.0'})       # Listen on all local IPs (on port 8080)
+cherrypy.config.update({'server.thread_pool': SERVER_THREADS})   # Leave room for the /ajax/events connections
 cherrypy.tree.mount(root, '/', config=CONFIG)                   # Mount the app on the root
 cherrypy.engine.start()                                         # Start the web server